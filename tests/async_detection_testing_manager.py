@@ -0,0 +1,469 @@
+import asyncio
+import gzip
+import json
+import time
+import uuid
+import urllib.parse
+
+import aiohttp
+
+from detection_testing_manager import (
+    HEC_INPUT_NAME,
+    HEC_INPUT_PATH,
+    as_search_command,
+    first_match_search,
+    scope_search,
+    search_job_args,
+)
+from hec_client import HEC_INVALID_TOKEN, LatencyHistogram, backoff_delays
+from sigma_conversion import ConversionCache, convert_sigma_to_splunk
+from sysmon_events import iter_event_chunks
+
+
+# Searches run server-side for as long as they need
+SEARCH_TIMEOUT = aiohttp.ClientTimeout(total=None)
+
+
+class SplunkRestError(Exception):
+    """A Splunk REST call answered with an HTTP error status."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncDetectionTestingManager:
+    """
+    asyncio counterpart of DetectionTestingManager.
+
+    Searches go to the Splunk REST API and attack data to HEC over one
+    aiohttp session, so a single event loop can keep many rule tests in
+    flight without a thread per rule. Use it as an async context manager:
+
+        async with AsyncDetectionTestingManager(host, user, password) as manager:
+            await manager.send_attack_data(...)
+    """
+
+    def __init__(
+        self,
+        host,
+        username,
+        password,
+        conversion_cache=None,
+        verify_ssl: bool = False,
+        max_connections: int = 100,
+        hec_timeout: float = 30.0,
+        hec_chunk_bytes: int = 1024 * 1024,
+        hec_compress: bool = False,
+        hec_ack_timeout: float = 60.0,
+        first_match: bool = False,
+        hec_token_cache=None,
+    ):
+        """
+        Args:
+            host: Splunk host, used for both the management port and HEC
+            username: Splunk username
+            password: Splunk password
+            conversion_cache: Optional shared ConversionCache
+            verify_ssl: Verify Splunk's TLS certificates
+            max_connections: Maximum number of open connections to Splunk
+            hec_timeout: Timeout for each HEC and non-search REST request, in seconds
+            hec_chunk_bytes: Maximum size of each HEC upload
+            hec_compress: Send attack data gzip-compressed
+            hec_ack_timeout: Seconds to wait for HEC to acknowledge an upload
+            first_match: Let detection searches stop at their first result
+            hec_token_cache: Optional hec_client.HecTokenCache shared with
+                later runs
+        """
+        self.host = host
+        self.username = username
+        self.password = password
+        self.conversion_cache = conversion_cache or ConversionCache()
+        self.verify_ssl = verify_ssl
+        self.max_connections = max_connections
+        self.hec_timeout = hec_timeout
+        self.hec_chunk_bytes = hec_chunk_bytes
+        self.hec_compress = hec_compress
+        self.hec_ack_timeout = hec_ack_timeout
+        self.first_match = first_match
+        self.hec_token_cache = hec_token_cache
+        self.management_url = f"https://{host}:8089"
+        self.session = None
+        self.session_key = None
+        self.hec_token = None
+        self.hec_channel = None
+        self._hec_lock = asyncio.Lock()
+        # Time from each HEC post to its ack reporting the data as indexed
+        self.ack_latency = LatencyHistogram()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def connect(self):
+        """Open the HTTP session and log in to the Splunk management port."""
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections, ssl=self.verify_ssl
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.hec_timeout),
+        )
+        response = await self._rest(
+            "POST",
+            "/services/auth/login",
+            authenticate=False,
+            data={"username": self.username, "password": self.password},
+        )
+        self.session_key = response["sessionKey"]
+
+    async def close(self):
+        """Close every pooled connection."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _rest(self, method: str, path: str, authenticate: bool = True,
+                    **kwargs):
+        """Call the Splunk REST API and return the decoded JSON response."""
+        headers = {}
+        if authenticate:
+            headers["Authorization"] = f"Splunk {self.session_key}"
+        params = dict(kwargs.pop("params", {}), output_mode="json")
+
+        async with self.session.request(
+            method,
+            urllib.parse.urljoin(self.management_url, path),
+            headers=headers,
+            params=params,
+            **kwargs,
+        ) as res:
+            body = await res.text()
+            if res.status >= 400:
+                raise SplunkRestError(
+                    f"Splunk REST call {method} {path} failed "
+                    f"with HTTP {res.status}: {body}",
+                    res.status,
+                )
+            return json.loads(body) if body else {}
+
+    async def _oneshot(self, search: str, **params):
+        """Run a search to completion and return its result rows."""
+        response = await self._rest(
+            "POST",
+            "/services/search/jobs",
+            timeout=SEARCH_TIMEOUT,
+            data={"search": search, "exec_mode": "oneshot", **params},
+        )
+        return response.get("results", [])
+
+    def sigma_to_splunk_conversion(
+        self, sigma_detection: dict, index: str = None, event_host: str = None
+    ):
+        splunk_search = convert_sigma_to_splunk(
+            sigma_detection, self.conversion_cache
+        )
+        return scope_search(splunk_search, index=index, event_host=event_host)
+
+    async def configure_hec(self, refresh: bool = False, rejected_token: str = None):
+        """
+        Resolve the DETECTION_TESTING_HEC token and a request channel.
+
+        The token and request channel are resolved once and shared by every
+        concurrent upload; ackIds are unique per channel, so the uploads
+        never confuse each other's acknowledgements. As in
+        DetectionTestingManager.configure_hec, the token comes from memory,
+        the optional on-disk cache or a REST lookup, in that order.
+
+        Args:
+            refresh: Look the token up again because HEC rejected it
+            rejected_token: The token HEC rejected; when other uploads have
+                already replaced it, refresh is skipped
+        """
+        async with self._hec_lock:
+            if self.hec_channel is None:
+                self.hec_channel = str(uuid.uuid4())
+
+            if refresh:
+                if self.hec_token != rejected_token:
+                    return
+                self.hec_token = None
+                if self.hec_token_cache is not None:
+                    self.hec_token_cache.invalidate(self.host)
+            elif self.hec_token is None and self.hec_token_cache is not None:
+                self.hec_token = self.hec_token_cache.get(self.host)
+
+            if self.hec_token is not None:
+                return
+
+            self.hec_token = await self._lookup_hec_token()
+            if self.hec_token_cache is not None:
+                self.hec_token_cache.set(self.host, self.hec_token)
+
+    async def _lookup_hec_token(self):
+        try:
+            response = await self._rest("GET", HEC_INPUT_PATH)
+        except SplunkRestError as e:
+            if e.status != 404:
+                raise (
+                    Exception(
+                        f"Could not look up the {HEC_INPUT_NAME} HEC input: {str(e)}"
+                    )
+                )
+            try:
+                response = await self._rest(
+                    "POST",
+                    "/servicesNS/nobody/splunk_httpinput/data/inputs/http",
+                    data={
+                        "name": HEC_INPUT_NAME,
+                        "index": "test",
+                        "indexes": "test",
+                        "useACK": "1",
+                    },
+                )
+            except Exception as e:
+                raise (
+                    Exception(
+                        f"Could not create the {HEC_INPUT_NAME} HEC input: {str(e)}"
+                    )
+                )
+
+        return str(response["entry"][0]["content"]["token"])
+
+    def _hec_headers(self, compress: bool = False):
+        headers = {
+            "Authorization": f"Splunk {self.hec_token}",
+            "X-Splunk-Request-Channel": self.hec_channel,
+        }
+        if compress:
+            headers["Content-Encoding"] = "gzip"
+        return headers
+
+    async def _hec_post(self, hec_url: str, path: str, **kwargs):
+        async with self.session.post(
+            urllib.parse.urljoin(hec_url, path), **kwargs
+        ) as res:
+            return await res.json(content_type=None)
+
+    async def _send_to_hec(self, hec_url: str, path: str, compress: bool = False,
+                           **kwargs):
+        """Post to HEC, retrying once with a fresh token if HEC rejected it."""
+        token = self.hec_token
+        jsonResponse = await self._hec_post(
+            hec_url, path, headers=self._hec_headers(compress), **kwargs
+        )
+        if jsonResponse.get("code") == HEC_INVALID_TOKEN:
+            await self.configure_hec(refresh=True, rejected_token=token)
+            jsonResponse = await self._hec_post(
+                hec_url, path, headers=self._hec_headers(compress), **kwargs
+            )
+        return jsonResponse
+
+    async def send_attack_data(
+        self,
+        file_path: str,
+        source: str,
+        sourcetype: str,
+        host: str,
+        verify_ssl: bool = False,
+        event_host: str = "test",
+    ):
+        await self.configure_hec()
+        hec_url = f"https://{host}:8088"
+
+        url_params = {
+            "index": "test",
+            "source": source,
+            "sourcetype": sourcetype,
+            "host": event_host,
+        }
+
+        ack_ids = {}
+        for chunk in iter_event_chunks(file_path, self.hec_chunk_bytes):
+            if self.hec_compress:
+                chunk = gzip.compress(chunk, compresslevel=6)
+            try:
+                jsonResponse = await self._send_to_hec(
+                    hec_url,
+                    "services/collector/raw",
+                    compress=self.hec_compress,
+                    params=url_params,
+                    data=chunk,
+                    ssl=verify_ssl,
+                )
+
+            except Exception as e:
+                raise (
+                    Exception(
+                        f"There was an exception sending attack_data to HEC: {str(e)}"
+                    )
+                )
+
+            if "ackId" not in jsonResponse:
+                raise (
+                    Exception(
+                        f"key 'ackID' not present in response from HEC server: "
+                        f"{jsonResponse}"
+                    )
+                )
+            ack_ids[jsonResponse["ackId"]] = time.monotonic()
+
+        await self.wait_for_acks(hec_url, ack_ids, verify_ssl=verify_ssl)
+
+    async def wait_for_acks(
+        self,
+        hec_url: str,
+        ack_ids: dict,
+        verify_ssl: bool = False,
+        initial_delay: float = 0.02,
+        max_delay: float = 2.0,
+        timeout: float = None,
+    ):
+        """
+        Wait until HEC acknowledges every ackId as indexed.
+
+        Same polling schedule as DetectionTestingManager.wait_for_acks, but
+        sleeping yields to the event loop instead of blocking a thread.
+
+        Args:
+            hec_url: Base URL of the collector the data was posted to
+            ack_ids: Mapping of ackId to the time.monotonic() it was posted at
+        """
+        if timeout is None:
+            timeout = self.hec_ack_timeout
+        pending = {str(ack_id): sent_at for ack_id, sent_at in ack_ids.items()}
+        deadline = time.monotonic() + timeout
+        delays = backoff_delays(initial_delay, max_delay, jitter=0.5)
+
+        while pending:
+            delay = next(delays)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise Exception(
+                    f"Failed to receive HEC acknowledgment for ackIDs "
+                    f"{sorted(pending)} within {timeout:g}s"
+                )
+            await asyncio.sleep(min(delay, remaining))
+
+            try:
+                jsonResponse = await self._hec_post(
+                    hec_url,
+                    "services/collector/ack",
+                    json={"acks": [int(ack_id) for ack_id in pending]},
+                    headers=self._hec_headers(),
+                    ssl=verify_ssl,
+                )
+
+                if "acks" not in jsonResponse or not set(pending) <= set(jsonResponse["acks"]):
+                    raise (
+                        Exception(
+                            f"Proper ackID structure not found for ackIDs "
+                            f"{sorted(pending)} in {jsonResponse}"
+                        )
+                    )
+            except Exception as e:
+                raise (Exception(f"There was an exception in the post: {str(e)}"))
+
+            now = time.monotonic()
+            for ack_id, acked in jsonResponse["acks"].items():
+                if acked is True and ack_id in pending:
+                    self.ack_latency.record(now - pending.pop(ack_id))
+
+    async def count_indexed_events(self, event_host: str, earliest_time=None,
+                                   latest_time=None):
+        """
+        Return how many events tagged with event_host are searchable in index=test.
+
+        Only events whose _time falls within earliest_time/latest_time are
+        counted, if given.
+        """
+        results = await self._oneshot(
+            f"| tstats count where index=test host={event_host}",
+            **search_job_args(earliest_time, latest_time),
+        )
+        if not results:
+            return 0
+        return int(results[0].get("count", 0))
+
+    async def wait_for_indexed_events(
+        self,
+        event_host: str,
+        expected_count: int,
+        timeout: float = 60.0,
+        initial_delay: float = 0.2,
+        max_delay: float = 5.0,
+        earliest_time=None,
+        latest_time=None,
+    ):
+        """
+        Poll index=test until expected_count events for event_host are searchable.
+
+        Returns the number of seconds it took for the events to become
+        searchable.
+
+        With earliest_time/latest_time, only events within that window count,
+        so events indexed with the wrong _time (e.g. because the timestamp
+        was not extracted) fail here instead of in the detection search.
+        """
+        start = time.monotonic()
+        window = ""
+        if earliest_time is not None or latest_time is not None:
+            window = f" in window {earliest_time}-{latest_time}"
+        delays = backoff_delays(initial_delay, max_delay)
+
+        while True:
+            indexed = await self.count_indexed_events(
+                event_host, earliest_time, latest_time
+            )
+            elapsed = time.monotonic() - start
+            if indexed >= expected_count:
+                return elapsed
+
+            delay = next(delays)
+            if elapsed + delay > timeout:
+                raise Exception(
+                    f"Only {indexed}/{expected_count} events for host={event_host} "
+                    f"were searchable{window} after {elapsed:.1f}s"
+                )
+
+            await asyncio.sleep(delay)
+
+    async def delete_attack_data(self, event_host: str = None):
+        index = "test"
+        if event_host:
+            splunk_search = f'search index={index} host={event_host} | delete'
+        else:
+            splunk_search = f'search index={index} | delete'
+        try:
+            await self._oneshot(splunk_search)
+
+        except Exception as e:
+            raise (
+                Exception(
+                    f"Trouble deleting data using the search {splunk_search}: {str(e)}"
+                )
+            )
+
+    async def run_detection(
+        self,
+        search: str,
+        earliest_time=None,
+        latest_time=None,
+        first_match: bool = None,
+    ):
+        """Awaitable DetectionTestingManager.run_detection."""
+        if first_match is None:
+            first_match = self.first_match
+        search = as_search_command(search)
+        if first_match:
+            search = first_match_search(search)
+
+        # A oneshot job runs to completion server-side; awaiting it only
+        # parks this coroutine, so other tests keep running meanwhile
+        results = await self._oneshot(
+            search, count=1, **search_job_args(earliest_time, latest_time)
+        )
+        return len(results) > 0
@@ -0,0 +1,3 @@
+# test_detections.py is the detection test runner script; its test_*
+# functions take a live Splunk manager and are not pytest tests
+collect_ignore = ["test_detections.py"]
@@ -1,9 +1,66 @@
+import argparse
 from pathlib import Path
-from detection_deployer import DetectionDeployer
+from detection_deployer import SCHEDULE_PERIOD, DetectionDeployer, projected_load
+from sigma_conversion import rule_key
 from test_detections import load_environment_variables, find_yaml_files, load_sigma_detection
 
 
+def print_projected_load(desired):
+    """Print how many detections the scheduler starts in each minute of the period."""
+    load = projected_load(desired)
+    print(f"\n📅 Projected scheduler load ({len(desired)} detections, "
+          f"every {SCHEDULE_PERIOD} minutes):")
+    for minute in range(SCHEDULE_PERIOD):
+        print(f"  minute +{minute}: {load[minute]} search(es)")
+    print(f"  peak: {max(load)} search(es) per minute")
+
+
 def main():
+    parser = argparse.ArgumentParser(
+        description="Deploy sigma detection rules to Splunk as saved searches"
+    )
+    parser.add_argument(
+        'folder_path',
+        nargs='?',
+        default='detections',
+        help='Path to folder containing sigma detection YAML files (default: detections)'
+    )
+    parser.add_argument(
+        '--sync',
+        action='store_true',
+        help='Diff against the deployed saved searches and only write the ones that differ'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=8,
+        help='Concurrent REST writes in --sync mode (default: 8)'
+    )
+    parser.add_argument(
+        '--prune',
+        action='store_true',
+        help='Delete deployed detections whose rule no longer exists (requires --sync)'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Only print what would change (requires --sync)'
+    )
+    parser.add_argument(
+        '--group-by-logsource',
+        action='store_true',
+        help='Run same-logsource detections as one shared saved search each '
+             '(requires --sync --prune); the per-rule saved searches a group '
+             'replaces are deleted by name'
+    )
+    args = parser.parse_args()
+    if (args.dry_run or args.prune) and not args.sync:
+        parser.error("--dry-run and --prune require --sync")
+    if args.group_by_logsource and not (args.sync and args.prune):
+        # Otherwise the per-rule searches a group replaces keep running
+        # next to it and every grouped rule alerts twice
+        parser.error("--group-by-logsource requires --sync --prune")
+
     print("Loading environment variables...")
     env_vars = load_environment_variables()
     deployer = DetectionDeployer(
@@ -13,8 +70,9 @@ def main():
         lab_host="lab8"
     )
 
-    yaml_files = find_yaml_files("detections")
+    yaml_files = find_yaml_files(args.folder_path)
 
+    detections = []
     for yaml_file in yaml_files:
         file_name = Path(yaml_file).name
         file_name = file_name.split('.')[0]
@@ -23,12 +81,63 @@ def main():
         detection_data = load_sigma_detection(yaml_file)
         if detection_data is None:
             print(f"❌ Skipping {file_name} due to loading errors")
-            failed_tests += 1
             continue
 
-        deployer.sigma_to_splunk_conversion(detection_data)
-        deployer.deploy_splunk_detection(detection_data, file_name)
-        print(f"✅ Successfully deployed: {file_name}")
+        detections.append((file_name, detection_data))
+
+    # Convert the whole rule set in one batch with a shared backend
+    searches, errors = deployer.convert_detections(
+        [detection_data for _, detection_data in detections]
+    )
+    print(f"\nConverted {len(searches)} detections ({len(errors)} errors)")
+
+    deployable = []
+    for file_name, detection_data in detections:
+        key = rule_key(detection_data)
+        if key in errors:
+            print(f"❌ Skipping {file_name}: conversion failed: {errors[key]}")
+            continue
+        deployable.append((file_name, detection_data, searches[key]))
+
+    if args.group_by_logsource:
+        desired = deployer.group_detections(deployable)
+    else:
+        desired = {
+            file_name: deployer.saved_search_properties(detection_data, splunk_search)
+            for file_name, detection_data, splunk_search in deployable
+        }
+    # Per-rule searches now run by a group search; pruned by name, since ones
+    # deployed by older versions of this script aren't marked as managed
+    superseded = {
+        file_name for file_name, _, _ in deployable if file_name not in desired
+    }
+    print_projected_load(desired)
+
+    if args.sync:
+        plan, failures = deployer.sync_detections(
+            desired, workers=args.workers, prune=args.prune, dry_run=args.dry_run,
+            superseded=superseded,
+        )
+
+        done = {'create': "Created", 'update': "Updated", 'delete': "Deleted"}
+        for action in ('create', 'update', 'delete'):
+            for name in plan[action]:
+                if name in failures:
+                    print(f"❌ Failed to {action}: {name}: {failures[name]}")
+                elif args.dry_run:
+                    print(f"Would {action}: {name}")
+                else:
+                    print(f"✅ {done[action]}: {name}")
+        print(f"\n{len(plan['create'])} to create, {len(plan['update'])} to update, "
+              f"{len(plan['delete'])} to delete, {len(plan['unchanged'])} unchanged"
+              f"{f', {len(failures)} failed' if failures else ''}")
+        return
+
+    for name, properties in desired.items():
+        if deployer.deploy_saved_search(name, properties):
+            print(f"✅ Successfully deployed: {name}")
+        else:
+            print(f"❌ Failed to deploy: {name}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,11 +1,112 @@
+import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+
 import splunklib.client as client
-from sigma.collection import SigmaCollection
-from sigma.backends.splunk import SplunkBackend
+from sigma_conversion import (
+    ConversionCache, combined_rule_search, convert_sigma_rules,
+    convert_sigma_to_splunk, eval_string, is_event_search, rule_key,
+)
+
+
+# Saved searches whose description starts with this are owned by the
+# deployer, so sync mode may delete them once their rule is gone
+MANAGED_DESCRIPTION_PREFIX = "[sigma-deployer]"
+
+
+# Detections run every SCHEDULE_PERIOD minutes, staggered across the period
+SCHEDULE_PERIOD = 5
+
+CONTENT_HASH_PATTERN = re.compile(r"\bcontent=([0-9a-f]+)")
+
+
+def content_hash(properties: dict):
+    """Hash the saved search properties a detection is deployed with."""
+    normalized = json.dumps(
+        {key: _normalize_property(value) for key, value in properties.items()},
+        sort_keys=True,
+    )
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def description_content_hash(description: str):
+    """Return the content hash recorded in a saved search description, if any."""
+    match = CONTENT_HASH_PATTERN.search(description or "")
+    return match.group(1) if match else None
+
+
+def schedule_offset(rule_id: str, period: int = SCHEDULE_PERIOD):
+    """Map a rule id to a stable minute offset within the schedule period."""
+    digest = hashlib.sha256(str(rule_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % period
+
+
+def staggered_cron(offset: int, period: int = SCHEDULE_PERIOD):
+    """Cron schedule firing every period minutes, offset minutes past the hour."""
+    return f"{offset}-59/{period} * * * *"
+
+
+def cron_minutes(cron_schedule: str):
+    """
+    Expand the minute field of a cron schedule into the minutes it fires at.
+    
+    Supports '*', single values, 'a-b' ranges, '/step' and comma lists.
+    """
+    minutes = set()
+    for part in cron_schedule.split()[0].split(','):
+        field, _, step = part.partition('/')
+        if field == '*':
+            start, end = 0, 59
+        elif '-' in field:
+            start, end = (int(value) for value in field.split('-', 1))
+        else:
+            start = int(field)
+            end = 59 if step else start
+        minutes.update(range(start, end + 1, int(step) if step else 1))
+    return minutes
+
+
+def projected_load(desired: dict):
+    """
+    Count how many scheduled searches start in each minute of the hour.
+    
+    Args:
+        desired: Saved search name -> properties from saved_search_properties
+        
+    Returns:
+        list: 60 counts, one per minute past the hour
+    """
+    load = [0] * 60
+    for properties in desired.values():
+        if not properties.get('is_scheduled'):
+            continue
+        for minute in cron_minutes(properties['cron_schedule']):
+            load[minute] += 1
+    return load
+
+
+def logsource_key(sigma_detection: dict):
+    """Identify a rule's logsource as 'category/product/service'."""
+    logsource = sigma_detection.get('logsource') or {}
+    return "/".join(
+        str(logsource.get(part) or "") for part in ("category", "product", "service")
+    ).strip("/")
+
+
+def _normalize_property(value):
+    """Render a saved search property the way Splunk reports it back."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return str(value).strip()
 
 
 class DetectionDeployer:
     
-    def __init__(self, host, username, password, lab_host="lab1"):
+    def __init__(self, host, username, password, lab_host="lab1",
+                 conversion_cache=None):
         """
         Initialize the DetectionDeployer.
         
@@ -14,6 +115,8 @@ class DetectionDeployer:
             username: Splunk username
             password: Splunk password
             lab_host: Lab host identifier (e.g., "lab1", "lab2", etc.)
+            conversion_cache: Optional ConversionCache shared with other tools;
+                a default on-disk cache is used if None
         """
         self.conn = client.connect(
             host=host,
@@ -22,73 +125,355 @@ class DetectionDeployer:
             password=password,
         )
         self.lab_host = lab_host
+        self.conversion_cache = conversion_cache or ConversionCache()
 
     def sigma_to_splunk_conversion(self, sigma_detection: dict):
         """
         Convert a Sigma detection to Splunk search query.
         
+        Conversions are memoized on disk by rule content and pySigma version.
+        
         Args:
             sigma_detection: Dictionary containing Sigma detection rule
             
         Returns:
             str: Splunk search query
         """
-        sigma_collection = SigmaCollection.from_dicts([sigma_detection])
-        splunk_backend = SplunkBackend()
-        splunk_search = splunk_backend.convert(sigma_collection)[0]
-        return splunk_search
+        return convert_sigma_to_splunk(sigma_detection, self.conversion_cache)
+
+    def convert_detections(self, sigma_detections):
+        """
+        Convert a whole rule set to Splunk searches in one batch.
+        
+        Args:
+            sigma_detections: List of dictionaries containing Sigma rules
+            
+        Returns:
+            tuple: (searches, errors) dictionaries keyed by rule id
+        """
+        return convert_sigma_rules(sigma_detections, self.conversion_cache)
+
+    def saved_search_properties(self, sigma_detection: dict, splunk_search: str):
+        """
+        Build the saved search settings a converted detection is deployed with.
+        
+        The description marks the search as deployer-managed and records a
+        hash of all other properties, so an unchanged rule can be detected
+        without comparing every field. Schedules are staggered across the
+        SCHEDULE_PERIOD by a hash of the rule id, so detections don't all
+        fire in the same minute, and each run searches the whole minutes
+        since the previous one.
+        
+        Args:
+            sigma_detection: Dictionary containing Sigma detection rule
+            splunk_search: Converted Splunk search
+            
+        Returns:
+            dict: Saved search properties, including the search itself
+        """
+        rule_id = sigma_detection.get('id') or sigma_detection.get('title')
+        return self._scheduled_search_properties(
+            rule_id, f"index=win host={self.lab_host} {splunk_search}"
+        )
+
+    def group_search_properties(self, group: str, rules):
+        """
+        Build one saved search that runs many same-logsource rules together.
+        
+        The rules' searches are combined with combined_rule_search, so the
+        lab's events are scanned once per run for the whole group. Each
+        result is one event paired with one rule it matched, carrying that
+        rule's id and title, and alerts fire per result, suppressed per rule_id until
+        the next run, so every rule still alerts on its own.
+        
+        Args:
+            group: Group name, e.g. the logsource_key shared by the rules
+            rules: List of (sigma_detection, splunk_search) pairs whose
+                searches satisfy is_event_search
+            
+        Returns:
+            dict: Saved search properties, including the search itself
+        """
+        searches = {}
+        titles = []
+        for sigma_detection, splunk_search in rules:
+            key = rule_key(sigma_detection)
+            searches[key] = splunk_search
+            title = str(sigma_detection.get('title') or key)
+            titles.append(f'rule_id=={eval_string(key)}, {eval_string(title)}')
+        
+        search = (
+            f"index=win host={self.lab_host} {combined_rule_search(searches)} "
+            f"| mvexpand rule_id "
+            f"| eval rule_title=case({', '.join(titles)})"
+        )
+        return self._scheduled_search_properties(
+            f"logsource={group}",
+            search,
+            {
+                'alert.digest_mode': False,  # One alert per result
+                'alert.suppress': True,
+                'alert.suppress.fields': 'rule_id',
+                # Lifts before the next scheduled run
+                'alert.suppress.period': f'{SCHEDULE_PERIOD - 1}m',
+            },
+        )
+
+    def _scheduled_search_properties(self, deployment_id: str, search: str,
+                                     extra: dict = None):
+        properties = {
+            'search': search,
+            'is_scheduled': True,
+            # Run every 5 minutes, at a deployment-specific minute offset
+            'cron_schedule': staggered_cron(schedule_offset(deployment_id)),
+            'dispatch.earliest_time': f'-{SCHEDULE_PERIOD}m@m',
+            'dispatch.latest_time': '@m',
+            'request.ui_dispatch_app': 'search',
+            'request.ui_dispatch_view': 'search',
+            'alert_type': 'number of events',
+            'alert_comparator': 'greater than',
+            'alert_threshold': '0',
+            'alert.track': '1',  # Add to triggered alerts
+        }
+        properties.update(extra or {})
+        properties['description'] = (
+            f"{MANAGED_DESCRIPTION_PREFIX} {deployment_id} "
+            f"content={content_hash(properties)}"
+        )
+        return properties
+
+    def group_detections(self, detections):
+        """
+        Plan saved searches with same-logsource rules sharing one search.
+        
+        Rules are grouped by logsource_key. Groups of two or more rules
+        whose searches can be combined become one group saved search named
+        'Sigma group - <logsource>'; every other rule keeps its own search.
+        
+        Args:
+            detections: List of (detection_name, sigma_detection,
+                splunk_search) tuples
+            
+        Returns:
+            dict: Saved search name -> properties
+        """
+        groups = {}
+        desired = {}
+        for detection_name, sigma_detection, splunk_search in detections:
+            if is_event_search(splunk_search):
+                groups.setdefault(logsource_key(sigma_detection), []).append(
+                    (detection_name, sigma_detection, splunk_search)
+                )
+            else:
+                desired[detection_name] = self.saved_search_properties(
+                    sigma_detection, splunk_search
+                )
+        
+        for group, members in groups.items():
+            if len(members) == 1:
+                detection_name, sigma_detection, splunk_search = members[0]
+                desired[detection_name] = self.saved_search_properties(
+                    sigma_detection, splunk_search
+                )
+                continue
+            
+            # Saved search names end up in REST paths, so avoid '/'
+            name = f"Sigma group - {group.replace('/', '_') or 'unknown'}"
+            desired[name] = self.group_search_properties(
+                group,
+                [(sigma_detection, splunk_search)
+                 for _, sigma_detection, splunk_search in members],
+            )
+        
+        return desired
+
+    def fetch_saved_searches(self):
+        """
+        Fetch every saved search visible to the deployer in one REST call.
+        
+        Returns:
+            dict: Saved search name -> splunklib SavedSearch entity
+        """
+        return {search.name: search for search in self.conn.saved_searches.list()}
+
+    def plan_sync(self, desired: dict, existing: dict, prune: bool = False,
+                  superseded=()):
+        """
+        Work out which saved searches to create, update and delete.
+        
+        A saved search is updated when any desired property differs from
+        what Splunk reports for it. With prune, deployer-managed searches
+        (see MANAGED_DESCRIPTION_PREFIX) that no longer have a rule are
+        deleted, as are the superseded searches, which a group search now
+        runs; other saved searches are never touched.
+        
+        Args:
+            desired: Saved search name -> properties from saved_search_properties
+            existing: Saved search name -> entity from fetch_saved_searches
+            prune: Delete managed searches missing from desired
+            superseded: Names of per-rule searches replaced by group searches,
+                deleted with prune even without a managed description, as
+                deployed by earlier versions of the deployer
+            
+        Returns:
+            dict: Lists of names under 'create', 'update', 'delete' and
+                'unchanged'
+        """
+        plan = {'create': [], 'update': [], 'delete': [], 'unchanged': []}
+        
+        for name, properties in desired.items():
+            if name not in existing:
+                plan['create'].append(name)
+                continue
+            
+            content = existing[name].content
+            if any(
+                _normalize_property(content.get(key, "")) != _normalize_property(value)
+                for key, value in properties.items()
+            ):
+                plan['update'].append(name)
+            else:
+                plan['unchanged'].append(name)
+        
+        if prune:
+            for name, search in existing.items():
+                description = search.content.get('description') or ""
+                if name not in desired and (
+                        description.startswith(MANAGED_DESCRIPTION_PREFIX)
+                        or name in superseded):
+                    plan['delete'].append(name)
+        
+        return plan
+
+    def sync_detections(self, desired: dict, workers: int = 8, prune: bool = False,
+                        dry_run: bool = False, superseded=()):
+        """
+        Bring Splunk's saved searches in line with the desired detections.
+        
+        Existing saved searches are fetched once and diffed against desired;
+        only the searches that differ are created, updated in place or
+        deleted, with the REST writes spread over a pool of threads.
+        
+        Args:
+            desired: Saved search name -> properties from saved_search_properties
+            workers: Number of concurrent REST writes
+            prune: Delete managed searches whose rule no longer exists
+            dry_run: Only compute and return the plan
+            superseded: Per-rule search names replaced by group searches, see
+                plan_sync
+            
+        Returns:
+            tuple: (plan, failures) where plan is as returned by plan_sync and
+                failures maps the names of failed writes to their error
+        """
+        existing = self.fetch_saved_searches()
+        plan = self.plan_sync(desired, existing, prune=prune, superseded=superseded)
+        if dry_run:
+            return plan, {}
+        
+        saved_searches = self.conn.saved_searches
+        
+        def write(action, name):
+            try:
+                if action == 'create':
+                    properties = dict(desired[name])
+                    saved_searches.create(
+                        name=name, search=properties.pop('search'), **properties
+                    )
+                elif action == 'update':
+                    existing[name].update(**desired[name])
+                else:
+                    existing[name].delete()
+                return name, None
+            except Exception as e:
+                return name, str(e)
+        
+        jobs = [
+            (action, name)
+            for action in ('create', 'update', 'delete')
+            for name in plan[action]
+        ]
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            results = list(executor.map(lambda job: write(*job), jobs))
+        
+        failures = {name: error for name, error in results if error is not None}
+        return plan, failures
 
-    def deploy_splunk_detection(self, sigma_detection: dict, detection_name: str):
+    def deploy_splunk_detection(self, sigma_detection: dict, detection_name: str,
+                                splunk_search: str = None):
         """
         Deploy a Sigma detection to Splunk as a saved search.
         
+        An existing saved search is updated in place, keeping its alert
+        history and scheduler state, and is not written at all when its
+        stored content hash shows the rule is unchanged.
+        
         Args:
             sigma_detection: Dictionary containing Sigma detection rule
             detection_name: Name for the saved search in Splunk
+            splunk_search: Already converted search, e.g. from
+                convert_detections; converted here if None
             
         Returns:
             bool: True if deployment successful, False otherwise
         """
         try:
             # Convert Sigma to Splunk search
-            splunk_search = self.sigma_to_splunk_conversion(sigma_detection)
+            if splunk_search is None:
+                splunk_search = self.sigma_to_splunk_conversion(sigma_detection)
             
             # Prepend index and host filters
-            modified_search = f"index=win host={self.lab_host} {splunk_search}"
+            properties = self.saved_search_properties(sigma_detection, splunk_search)
+        
+        except Exception as e:
+            print(f"Error deploying detection {detection_name}: {str(e)}")
+            return False
+        
+        return self.deploy_saved_search(detection_name, properties)
+
+    def deploy_saved_search(self, name: str, properties: dict):
+        """
+        Create or update one saved search from deployment properties.
+        
+        An existing saved search is updated in place, and skipped when its
+        stored content hash matches.
+        
+        Args:
+            name: Saved search name
+            properties: Properties from saved_search_properties or
+                group_search_properties
             
+        Returns:
+            bool: True if deployment successful, False otherwise
+        """
+        properties = dict(properties)
+        try:
             # Deploy as saved search
             saved_searches = self.conn.saved_searches
             
-            # Check if saved search already exists and delete it
             try:
-                existing_search = saved_searches[detection_name]
-                existing_search.delete()
+                existing_search = saved_searches[name]
             except KeyError:
-                # Saved search doesn't exist, which is fine
-                pass
-            
-            # Create new saved search
-            saved_searches.create(
-                name=detection_name,
-                search=modified_search,
-                **{
-                    'is_scheduled': True,
-                    'cron_schedule': '*/5 * * * *',  # Run every 5 minutes
-                    'dispatch.earliest_time': '-5m',
-                    'dispatch.latest_time': 'now',
-                    'request.ui_dispatch_app': 'search',
-                    'request.ui_dispatch_view': 'search',
-                    'alert_type': 'number of events',
-                    'alert_comparator': 'greater than',
-                    'alert_threshold': '0',
-                    'alert.track': '1',  # Add to triggered alerts
-                }
-            )
+                existing_search = None
+            
+            if existing_search is None:
+                # Create new saved search
+                modified_search = properties.pop('search')
+                saved_searches.create(
+                    name=name,
+                    search=modified_search,
+                    **properties
+                )
+            elif (description_content_hash(existing_search.content.get('description'))
+                    == description_content_hash(properties['description'])):
+                print(f"Saved search {name} is unchanged, skipping")
+            else:
+                existing_search.update(**properties)
             
             return True
             
         except Exception as e:
-            print(f"Error deploying detection {detection_name}: {str(e)}")
+            print(f"Error deploying saved search {name}: {str(e)}")
             return False
 
     def list_deployed_detections(self):
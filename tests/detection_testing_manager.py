@@ -1,87 +1,232 @@
 import uuid
-import urllib
-import requests
+import itertools
 import json
 import time
 import splunklib.client as client
+from splunklib.binding import HTTPError
 
 
-from urllib3 import disable_warnings
-from sigma.collection import SigmaCollection
-from sigma.backends.splunk import SplunkBackend
+from hec_client import HEC_INVALID_TOKEN, HecClient, LatencyHistogram, backoff_delays
+from sigma_conversion import ConversionCache, convert_sigma_to_splunk
+from sysmon_events import iter_event_chunks, iter_raw_events, record_time
+
+
+HEC_INPUT_NAME = "DETECTION_TESTING_HEC"
+
+HEC_INPUT_PATH = (
+    "/servicesNS/nobody/splunk_httpinput/data/inputs/http/"
+    f"http:%2F%2F{HEC_INPUT_NAME}"
+)
+
+
+def make_run_id():
+    """Generate a unique id for a test run; every host tag it sends starts with it."""
+    return f"dt-{uuid.uuid4().hex[:12]}"
+
+
+_event_host_numbers = itertools.count(1)
+
+
+def make_event_host(run_id: str):
+    """Generate a host value that isolates one rule's events within a test run."""
+    return f"{run_id}-{next(_event_host_numbers)}"
+
+
+def scope_search(splunk_search: str, index: str = None, event_host: str = None):
+    """Prefix a converted search with index (and optionally host) filters."""
+    filters = []
+    if index:
+        filters.append(f"index={index}")
+    if event_host:
+        filters.append(f"host={event_host}")
+
+    if not filters:
+        return splunk_search
+
+    base_filter = " ".join(filters)
+    # Handle different search formats
+    search_trimmed = splunk_search.strip()
+    if search_trimmed.startswith("|"):
+        # For pipe commands, add a base search before the pipe
+        return f"{base_filter} | {search_trimmed[1:].strip()}"
+    if search_trimmed.startswith("search "):
+        # Replace "search " with "search <filters> "
+        return f"search {base_filter} {search_trimmed[7:].strip()}"
+    # Add filters to the beginning
+    return f"{base_filter} {search_trimmed}"
+
+
+def as_search_command(search: str):
+    """Ensure searches that do not begin with '|' begin with 'search '."""
+    if not search.strip().startswith("|"):
+        if not search.strip().startswith("search "):
+            search = f"search {search}"
+    return search
+
+
+def first_match_search(search: str):
+    """Stop a search at its first result, which is all a pass/fail check needs."""
+    return f"{search.rstrip()} | head 1"
+
+
+def search_job_args(earliest_time=None, latest_time=None):
+    """Build the time-range arguments of a search job, leaving out unset bounds."""
+    kwargs = {}
+    if earliest_time is not None:
+        kwargs["earliest_time"] = earliest_time
+    if latest_time is not None:
+        kwargs["latest_time"] = latest_time
+    return kwargs
 
 
 class DetectionTestingManager:
 
-    def __init__(self, host, username, password):
+    def __init__(
+        self,
+        host,
+        username,
+        password,
+        conversion_cache=None,
+        hec_pool_size: int = 10,
+        hec_retries: int = 3,
+        hec_timeout: float = 30.0,
+        hec_chunk_bytes: int = 1024 * 1024,
+        hec_compress: bool = False,
+        hec_ack_timeout: float = 60.0,
+        first_match: bool = False,
+        hec_token_cache=None,
+    ):
         self.conn = client.connect(
             host=host,
             port=8089,
             username=username,
             password=password,
         )
+        self.conversion_cache = conversion_cache or ConversionCache()
+        self.hec_pool_size = hec_pool_size
+        self.hec_retries = hec_retries
+        self.hec_timeout = hec_timeout
+        self.hec_chunk_bytes = hec_chunk_bytes
+        self.hec_compress = hec_compress
+        self.hec_ack_timeout = hec_ack_timeout
+        # Let detection searches stop at their first result
+        self.first_match = first_match
+        # Optional hec_client.HecTokenCache shared with later runs
+        self.hec_token_cache = hec_token_cache
+        self.hec_token = None
+        self.hec_channel = None
+        self.hec_clients = {}
+        # Time from each HEC post to its ack reporting the data as indexed
+        self.ack_latency = LatencyHistogram()
 
-    def sigma_to_splunk_conversion(self, sigma_detection: dict, index: str = None):
-        sigma_collection = SigmaCollection.from_dicts([sigma_detection])
-        splunk_backend = SplunkBackend()
-        splunk_search = splunk_backend.convert(sigma_collection)[0]
-        
-        # Add index filter for false positive testing
-        if index:
-            # Handle different search formats
-            search_trimmed = splunk_search.strip()
-            if search_trimmed.startswith("|"):
-                # For pipe commands, add a base search before the pipe
-                splunk_search = f"index={index} | {search_trimmed[1:].strip()}"
-            elif search_trimmed.startswith("search "):
-                # Replace "search " with "search index=<index> "
-                splunk_search = f"search index={index} {search_trimmed[7:].strip()}"
-            else:
-                # Add index filter to the beginning
-                splunk_search = f"index={index} {search_trimmed}"
-        
-        return splunk_search
+    def get_hec_client(self, host: str, verify_ssl: bool = False):
+        """Return the pooled HecClient for host, creating it on first use."""
+        key = (host, verify_ssl)
+        if key not in self.hec_clients:
+            self.hec_clients[key] = HecClient(
+                host,
+                verify_ssl=verify_ssl,
+                pool_size=self.hec_pool_size,
+                retries=self.hec_retries,
+                timeout=self.hec_timeout,
+            )
+        return self.hec_clients[key]
 
-    def run_false_positive_test(self, sigma_detection: dict):
+    def sigma_to_splunk_conversion(
+        self, sigma_detection: dict, index: str = None, event_host: str = None
+    ):
+        splunk_search = convert_sigma_to_splunk(
+            sigma_detection, self.conversion_cache
+        )
+        return scope_search(splunk_search, index=index, event_host=event_host)
+
+    def run_false_positive_test(
+        self, sigma_detection: dict, earliest_time=None, latest_time=None
+    ):
         """
         Run false positive testing using index=test1 which contains non-malicious data.
         Returns True if no false positives (0 events), False if false positives detected.
+        earliest_time/latest_time optionally bound the searched time window.
         """
         # Convert sigma to splunk search with test1 index
         splunk_search = self.sigma_to_splunk_conversion(sigma_detection, index="test1")
         
         # Run the detection - we expect 0 results (no false positives)
-        result = self.run_detection(splunk_search)
+        result = self.run_detection(
+            splunk_search, earliest_time=earliest_time, latest_time=latest_time
+        )
         
         # For false positive testing, we want NO results (result should be False)
         # Return True if no false positives detected, False if false positives found
         return not result
 
-    def configure_hec(self):
-        self.hec_channel = str(uuid.uuid4())
-        try:
-            res = self.conn.input(
-                path="/servicesNS/nobody/splunk_httpinput/data/inputs/http/"
-                     "http:%2F%2FDETECTION_TESTING_HEC"
-            )
-            self.hec_token = str(res.token)
+    def configure_hec(self, refresh: bool = False):
+        """
+        Resolve the DETECTION_TESTING_HEC token and a request channel.
+
+        Both are resolved once per manager and reused by every upload. The
+        token comes from memory, then the optional on-disk token cache, and
+        only then from a REST lookup (creating the input if it is missing).
+        Pass refresh=True to look the token up again after HEC rejected it.
+        """
+        if self.hec_channel is None:
+            self.hec_channel = str(uuid.uuid4())
+
+        if refresh:
+            self.hec_token = None
+            if self.hec_token_cache is not None:
+                self.hec_token_cache.invalidate(self.conn.host)
+        elif self.hec_token is None and self.hec_token_cache is not None:
+            self.hec_token = self.hec_token_cache.get(self.conn.host)
+
+        if self.hec_token is not None:
             return
-        except Exception:
-            pass
+
+        self.hec_token = self._lookup_hec_token()
+        if self.hec_token_cache is not None:
+            self.hec_token_cache.set(self.conn.host, self.hec_token)
+
+    def _lookup_hec_token(self):
+        try:
+            res = self.conn.input(path=HEC_INPUT_PATH)
+            return str(res.token)
+        except HTTPError as e:
+            if e.status != 404:
+                raise (
+                    Exception(
+                        f"Could not look up the {HEC_INPUT_NAME} HEC input: {str(e)}"
+                    )
+                )
 
         try:
             res = self.conn.inputs.create(
-                name="DETECTION_TESTING_HEC",
+                name=HEC_INPUT_NAME,
                 kind="http",
                 index="test",
                 indexes="test",
                 useACK=True,
             )
-            self.hec_token = str(res.token)
-            return
+            return str(res.token)
 
-        except Exception:
-            pass
+        except Exception as e:
+            raise (
+                Exception(
+                    f"Could not create the {HEC_INPUT_NAME} HEC input: {str(e)}"
+                )
+            )
+
+    def _send_to_hec(self, post):
+        """
+        Call post() and retry once with a fresh token if HEC rejected the token.
+
+        post must read self.hec_token when called, so the retry picks up the
+        refreshed token.
+        """
+        jsonResponse = post()
+        if jsonResponse.get("code") == HEC_INVALID_TOKEN:
+            self.configure_hec(refresh=True)
+            jsonResponse = post()
+        return jsonResponse
 
     def send_attack_data(
         self,
@@ -90,40 +235,30 @@ class DetectionTestingManager:
         sourcetype: str,
         host: str,
         verify_ssl: bool = False,
+        event_host: str = "test",
     ):
-        if verify_ssl is False:
-            disable_warnings()
-
+        hec_client = self.get_hec_client(host, verify_ssl)
         self.configure_hec()
 
-        headers = {
-            "Authorization": f"Splunk {self.hec_token}",  
-            "X-Splunk-Request-Channel": self.hec_channel,
-        }
-
         url_params = {
             "index": "test",
             "source": source,
             "sourcetype": sourcetype,
-            "host": "test",
+            "host": event_host,
         }
 
-        url = urllib.parse.urljoin(
-            f"https://{host}:8088",
-            "services/collector/raw"
-        )
-
-        with open(file_path, "rb") as datafile:
+        # Stream the file in bounded chunks split on <Event> boundaries, so
+        # memory stays flat however large the file is; every chunk gets its
+        # own ackId and all of them are awaited together at the end
+        ack_ids = {}
+        for chunk in iter_event_chunks(file_path, self.hec_chunk_bytes):
             try:
-                res = requests.post(
-                    url,
-                    params=url_params,
-                    data=datafile.read(),
-                    allow_redirects=True,
-                    headers=headers,
-                    verify=verify_ssl,
+                jsonResponse = self._send_to_hec(
+                    lambda: hec_client.post_raw(
+                        self.hec_token, self.hec_channel, chunk, url_params,
+                        compress=self.hec_compress,
+                    )
                 )
-                jsonResponse = json.loads(res.text)
 
             except Exception as e:
                 raise (
@@ -132,63 +267,229 @@ class DetectionTestingManager:
                     )
                 )
 
-        if "ackId" not in jsonResponse:
-            raise (
-                Exception(
-                    f"key 'ackID' not present in response from HEC server: "
-                    f"{jsonResponse}"
+            if "ackId" not in jsonResponse:
+                raise (
+                    Exception(
+                        f"key 'ackID' not present in response from HEC server: "
+                        f"{jsonResponse}"
+                    )
                 )
-            )
+            ack_ids[jsonResponse["ackId"]] = time.monotonic()
 
-        ackId = jsonResponse["ackId"]
-        url_with_hec_ack_path = urllib.parse.urljoin(
-            f"https://{host}:8088", "services/collector/ack"
-        )
+        self.wait_for_acks(hec_client, ack_ids)
 
-        requested_acks = {"acks": [jsonResponse["ackId"]]}
-        attempt_count = 0
-        max_attempts = 10
-        
-        while attempt_count < max_attempts:
+    def send_attack_data_batch(
+        self,
+        attack_data: list,
+        host: str,
+        verify_ssl: bool = False,
+        max_batch_bytes: int = 5 * 1024 * 1024,
+    ):
+        """
+        Send the data files of many detections to HEC with a single ack wait.
+
+        Every event is posted to /services/collector/event as a JSON object
+        carrying its own source, sourcetype, host tag and TimeCreated time, so
+        many files share each request. All ackIds are then resolved together
+        with one /services/collector/ack call per poll cycle.
+
+        Args:
+            attack_data: List of dicts with file_path, source, sourcetype and
+                event_host keys, one per detection
+            host: Splunk HEC host
+            verify_ssl: Verify the collector's TLS certificate
+            max_batch_bytes: Start a new request once a batch reaches this size
+        """
+        hec_client = self.get_hec_client(host, verify_ssl)
+        self.configure_hec()
+
+        def post_batch(batch):
             try:
-                res = requests.post(
-                    url_with_hec_ack_path,
-                    json=requested_acks,
-                    allow_redirects=True,
-                    headers=headers,
-                    verify=verify_ssl,
+                data = b"".join(batch)
+                jsonResponse = self._send_to_hec(
+                    lambda: hec_client.post_events(
+                        self.hec_token, self.hec_channel, data,
+                        compress=self.hec_compress,
+                    )
                 )
+            except Exception as e:
+                raise (
+                    Exception(
+                        f"There was an exception sending attack_data to HEC: {str(e)}"
+                    )
+                )
+            if "ackId" not in jsonResponse:
+                raise (
+                    Exception(
+                        f"key 'ackID' not present in response from HEC server: "
+                        f"{jsonResponse}"
+                    )
+                )
+            return jsonResponse["ackId"]
 
-                jsonResponse = json.loads(res.text)
+        ack_ids = {}
+        batch = []
+        batch_bytes = 0
+        for item in attack_data:
+            for record in iter_raw_events(item["file_path"]):
+                hec_event = {
+                    "event": record.decode("utf-8"),
+                    "index": "test",
+                    "source": item["source"],
+                    "sourcetype": item["sourcetype"],
+                    "host": item["event_host"],
+                }
+                event_time = record_time(record)
+                if event_time is not None:
+                    hec_event["time"] = f"{event_time:.3f}"
 
-                if "acks" in jsonResponse and str(ackId) in jsonResponse["acks"]:
-                    if jsonResponse["acks"][str(ackId)] is True:
-                        # ackID has been found for our request, 
-                        # we can return as the data has been replayed
-                        return
-                    else:
-                        # ackID is not yet true, we will wait some more
-                        attempt_count += 1
-                        if attempt_count < max_attempts:
-                            time.sleep(2)
+                encoded = json.dumps(hec_event).encode("utf-8")
+                if batch and batch_bytes + len(encoded) > max_batch_bytes:
+                    ack_ids[post_batch(batch)] = time.monotonic()
+                    batch = []
+                    batch_bytes = 0
+                batch.append(encoded)
+                batch_bytes += len(encoded)
+
+        if batch:
+            ack_ids[post_batch(batch)] = time.monotonic()
 
-                else:
+        self.wait_for_acks(hec_client, ack_ids)
+        return len(ack_ids)
+
+    def wait_for_acks(
+        self,
+        hec_client: HecClient,
+        ack_ids: dict,
+        initial_delay: float = 0.02,
+        max_delay: float = 2.0,
+        timeout: float = None,
+    ):
+        """
+        Wait until HEC acknowledges every ackId as indexed.
+
+        All outstanding ackIds are checked with a single ack request per poll.
+        The first check comes after initial_delay, then the interval backs off
+        exponentially with jitter up to max_delay, until the total timeout
+        (hec_ack_timeout by default) runs out. Each ack's latency from its
+        post is recorded in self.ack_latency.
+
+        Args:
+            hec_client: Client the data was posted with
+            ack_ids: Mapping of ackId to the time.monotonic() it was posted at
+        """
+        if timeout is None:
+            timeout = self.hec_ack_timeout
+        pending = {str(ack_id): sent_at for ack_id, sent_at in ack_ids.items()}
+        deadline = time.monotonic() + timeout
+        delays = backoff_delays(initial_delay, max_delay, jitter=0.5)
+
+        while pending:
+            delay = next(delays)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise Exception(
+                    f"Failed to receive HEC acknowledgment for ackIDs "
+                    f"{sorted(pending)} within {timeout:g}s"
+                )
+            time.sleep(min(delay, remaining))
+
+            try:
+                jsonResponse = hec_client.query_acks(
+                    self.hec_token, self.hec_channel, [int(ack_id) for ack_id in pending]
+                )
+
+                if "acks" not in jsonResponse or not set(pending) <= set(jsonResponse["acks"]):
                     raise (
                         Exception(
-                            f"Proper ackID structure not found for ackID {ackId} "
-                            f"in {jsonResponse}"
+                            f"Proper ackID structure not found for ackIDs "
+                            f"{sorted(pending)} in {jsonResponse}"
                         )
                     )
             except Exception as e:
                 raise (Exception(f"There was an exception in the post: {str(e)}"))
-        
-        raise Exception(
-            f"Failed to receive HEC acknowledgment after {max_attempts} attempts"
-        )
+
+            # Drop the ackIDs whose data has been indexed, and wait some more
+            # for the rest
+            now = time.monotonic()
+            for ack_id, acked in jsonResponse["acks"].items():
+                if acked is True and ack_id in pending:
+                    self.ack_latency.record(now - pending.pop(ack_id))
     
-    def delete_attack_data(self):
+    def count_indexed_events(self, event_host: str, earliest_time=None,
+                             latest_time=None):
+        """
+        Return how many events tagged with event_host are searchable in index=test.
+
+        Only events whose _time falls within earliest_time/latest_time are
+        counted, if given.
+        """
+        splunk_search = f"| tstats count where index=test host={event_host}"
+        response = self.conn.jobs.oneshot(
+            splunk_search, output_mode="json",
+            **search_job_args(earliest_time, latest_time),
+        )
+        results = json.loads(response.read()).get("results", [])
+        if not results:
+            return 0
+        return int(results[0].get("count", 0))
+
+    def wait_for_indexed_events(
+        self,
+        event_host: str,
+        expected_count: int,
+        timeout: float = 60.0,
+        initial_delay: float = 0.2,
+        max_delay: float = 5.0,
+        earliest_time=None,
+        latest_time=None,
+    ):
+        """
+        Poll index=test until expected_count events for event_host are searchable.
+
+        Polls a cheap tstats count with exponential backoff instead of sleeping
+        for a fixed time. Returns the number of seconds it took for the events
+        to become searchable.
+
+        With earliest_time/latest_time, only events within that window count,
+        so events indexed with the wrong _time (e.g. because the timestamp
+        was not extracted) fail here instead of in the detection search.
+        """
+        start = time.monotonic()
+        window = ""
+        if earliest_time is not None or latest_time is not None:
+            window = f" in window {earliest_time}-{latest_time}"
+        delays = backoff_delays(initial_delay, max_delay)
+
+        while True:
+            indexed = self.count_indexed_events(
+                event_host, earliest_time, latest_time
+            )
+            elapsed = time.monotonic() - start
+            if indexed >= expected_count:
+                return elapsed
+
+            delay = next(delays)
+            if elapsed + delay > timeout:
+                raise Exception(
+                    f"Only {indexed}/{expected_count} events for host={event_host} "
+                    f"were searchable{window} after {elapsed:.1f}s"
+                )
+
+            time.sleep(delay)
+
+    def delete_run_data(self, run_id: str):
+        """Delete every event a test run sent, with a single delete search."""
+        self.delete_attack_data(event_host=f"{run_id}-*")
+
+    def delete_attack_data(self, event_host: str = None):
         index = "test"
-        splunk_search = f'search index={index} | delete'
+        # Scope the delete to a single rule's events when a host tag is given,
+        # so concurrent tests don't wipe each other's data
+        if event_host:
+            splunk_search = f'search index={index} host={event_host} | delete'
+        else:
+            splunk_search = f'search index={index} | delete'
         kwargs = {"exec_mode": "blocking"}
         try:
             job = self.conn.jobs.create(splunk_search, **kwargs)
@@ -201,16 +502,192 @@ class DetectionTestingManager:
                 )
             )
         
-    def run_detection(self, search: str):
-        # Ensure searches that do not begin with '|' must begin with 'search '
-        if not search.strip().startswith("|"):
-            if not search.strip().startswith("search "):
-                search = f"search {search}"
+    def run_detection(
+        self,
+        search: str,
+        earliest_time=None,
+        latest_time=None,
+        first_match: bool = None,
+    ):
+        """
+        Run a search to completion and report whether it returned results.
 
-        kwargs = {"exec_mode": "blocking"}
+        Args:
+            search: Splunk search
+            earliest_time: Optional earliest time (epoch seconds or a Splunk
+                time modifier) to bound the searched buckets
+            latest_time: Optional latest time, likewise
+            first_match: Append '| head 1' so the search finishes at its first
+                result; defaults to the manager's first_match setting
+
+        Returns:
+            bool: True if the search returned at least one result
+        """
+        if first_match is None:
+            first_match = self.first_match
+        search = as_search_command(search)
+        if first_match:
+            search = first_match_search(search)
+
+        kwargs = {"exec_mode": "blocking", **search_job_args(earliest_time, latest_time)}
         job = self.conn.search(query=search, **kwargs)
         
         if int(job.content.get("resultCount", "0")) > 0:
             return True
         return False
+
+    def count_by_rule(
+        self,
+        search: str,
+        rule_field: str = "rule_id",
+        earliest_time=None,
+        latest_time=None,
+    ):
+        """
+        Count a rule-tagged search's events per rule id.
+
+        Args:
+            search: Search setting rule_field on each event, e.g. one built
+                by sigma_conversion.combined_rule_search
+            rule_field: Field holding the (multivalue) matching rule ids
+
+        Returns:
+            dict: rule id -> number of matching events, for rules with any
+        """
+        splunk_search = f"{as_search_command(search)} | stats count by {rule_field}"
+        response = self.conn.jobs.oneshot(
+            splunk_search,
+            output_mode="json",
+            count=0,
+            **search_job_args(earliest_time, latest_time),
+        )
+        results = json.loads(response.read()).get("results", [])
+        return {result[rule_field]: int(result["count"]) for result in results}
+
+    def job_states(self, jobs):
+        """
+        Fetch the state of the given search jobs, and only those.
+
+        Each job is refreshed with its own small GET, so the cost per poll is
+        bounded by the number of tracked jobs rather than by every job the
+        user owns on the search head.
+
+        Args:
+            jobs: Mapping of sid -> splunklib Job
+
+        Returns:
+            dict: sid -> job content (isDone, isFailed, resultCount, ...) for
+                every job Splunk still knows about; expired jobs are left out
+        """
+        states = {}
+        for sid, job in jobs.items():
+            try:
+                states[sid] = job.refresh().content
+            except HTTPError as e:
+                if e.status != 404:
+                    raise
+        return states
+
+    def run_detections(
+        self,
+        searches: dict,
+        max_concurrent: int = 10,
+        initial_delay: float = 0.1,
+        max_delay: float = 2.0,
+        first_match: bool = None,
+        time_ranges: dict = None,
+    ):
+        """
+        Run many searches as non-blocking jobs and report which found results.
+
+        Up to max_concurrent jobs are dispatched with exec_mode=normal, which
+        should not exceed the user's concurrent search quota. Only those jobs
+        are polled, with one small REST call each per cycle, and a queued search
+        is dispatched as soon as a running one finishes, so the wall time
+        tends towards that of the slowest search rather than the sum of all.
+
+        Args:
+            searches: Mapping of a caller-chosen key to a Splunk search
+            max_concurrent: Maximum number of jobs running at once
+            first_match: Stop each search at its first result; defaults to
+                the manager's first_match setting
+            time_ranges: Optional mapping of key to an (earliest_time,
+                latest_time) pair bounding that search
+
+        Returns:
+            dict: key -> True if the search returned results; False if it
+                returned none, the job failed or it could not be dispatched
+        """
+        if first_match is None:
+            first_match = self.first_match
+        time_ranges = time_ranges or {}
+        queued = list(searches.items())
+        queued.reverse()
+        running = {}
+        redispatched = set()
+        results = {}
+
+        try:
+            while queued or running:
+                while queued and len(running) < max_concurrent:
+                    key, search = queued.pop()
+                    search = as_search_command(search)
+                    if first_match:
+                        search = first_match_search(search)
+                    try:
+                        job = self.conn.jobs.create(
+                            search,
+                            exec_mode="normal",
+                            **search_job_args(*time_ranges.get(key, (None, None))),
+                        )
+                    except Exception as e:
+                        # E.g. the search quota is exhausted; the other
+                        # searches still get their turn
+                        print(f"❌ Could not dispatch search for {key}: {e}")
+                        results[key] = False
+                        continue
+                    running[job.sid] = (key, job)
+
+                if not running:
+                    continue
+
+                delays = backoff_delays(initial_delay, max_delay)
+                while True:
+                    time.sleep(next(delays))
+                    states = self.job_states(
+                        {sid: job for sid, (_, job) in running.items()}
+                    )
+                    finished = [
+                        sid for sid in running
+                        if sid not in states
+                        or states[sid].get("isDone") == "1"
+                        or states[sid].get("isFailed") == "1"
+                    ]
+                    if finished:
+                        break
+
+                for sid in finished:
+                    key, _ = running.pop(sid)
+                    content = states.get(sid)
+                    if content is None and key not in redispatched:
+                        # The job vanished (expired or deleted) before we saw
+                        # it finish; run the search once more
+                        print(f"⚠️ Search job {sid} for {key} disappeared, re-dispatching")
+                        redispatched.add(key)
+                        queued.append((key, searches[key]))
+                    elif content is None or content.get("isFailed") == "1":
+                        print(f"❌ Search job {sid} for {key} failed or expired")
+                        results[key] = False
+                    else:
+                        results[key] = int(content.get("resultCount", "0")) > 0
+        except BaseException:
+            # Don't leave searches running on the search head
+            for sid, (_, job) in running.items():
+                try:
+                    job.cancel()
+                except Exception as e:
+                    print(f"Warning: could not cancel search job {sid}: {e}")
+            raise
+
+        return results
     
\ No newline at end of file
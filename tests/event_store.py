@@ -0,0 +1,173 @@
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+from sigma_matcher import FieldMatcher
+from sysmon_events import iter_sysmon_events
+
+
+class ColumnarEventStore:
+    """
+    Sysmon events stored as dictionary-encoded NumPy columns.
+
+    Each field is kept as a list of its distinct values plus an int32 code
+    per event (-1 where the event lacks the field). A rule's field predicates
+    are evaluated once per distinct value and broadcast to every row through
+    the codes, so sweeping a rule over millions of benign events costs a few
+    vectorised NumPy operations instead of a Python call per event.
+    """
+
+    def __init__(self, fields=None):
+        """
+        Args:
+            fields: Optional set of field names to store; all fields if None
+        """
+        self.fields = set(fields) if fields is not None else None
+        self.event_count = 0
+        self._values = {}
+        self._lookup = {}
+        self._pending_codes = {}
+        self._codes = {}
+
+    @classmethod
+    def from_files(cls, file_paths, fields=None):
+        """
+        Build a store from Sysmon XML exports.
+
+        Args:
+            file_paths: Iterable of Sysmon XML files
+            fields: Optional set of field names to store; all fields if None
+
+        Returns:
+            ColumnarEventStore: Store holding every event from the files
+        """
+        store = cls(fields)
+        for file_path in file_paths:
+            store.extend(iter_sysmon_events(str(file_path), store.fields))
+        return store
+
+    def __len__(self):
+        return self.event_count
+
+    def _column(self, field: str):
+        codes = self._pending_codes.get(field)
+        if codes is None:
+            # Backfill rows seen before this field first appeared
+            codes = array("i", [-1]) * self.event_count
+            self._pending_codes[field] = codes
+            self._values[field] = []
+            self._lookup[field] = {}
+            self._codes.pop(field, None)
+        return codes
+
+    def append(self, event: dict):
+        """Add one parsed event to the store."""
+        for field, value in event.items():
+            if self.fields is not None and field not in self.fields:
+                continue
+            codes = self._column(field)
+            lookup = self._lookup[field]
+            code = lookup.get(value)
+            if code is None:
+                code = len(self._values[field])
+                lookup[value] = code
+                self._values[field].append(value)
+            codes.append(code)
+
+        self.event_count += 1
+        for codes in self._pending_codes.values():
+            if len(codes) < self.event_count:
+                codes.append(-1)
+
+    def extend(self, events):
+        """Add every event from an iterable of parsed events."""
+        for event in events:
+            self.append(event)
+
+    def codes(self, field: str):
+        """Return the int32 code column for a field (-1 where it is missing)."""
+        if field not in self._pending_codes:
+            return np.full(self.event_count, -1, dtype=np.int32)
+
+        codes = self._codes.get(field)
+        if codes is None or len(codes) != self.event_count:
+            codes = np.frombuffer(self._pending_codes[field], dtype=np.int32).copy()
+            self._codes[field] = codes
+        return codes
+
+    def _field_mask(self, field_matcher: FieldMatcher):
+        check = field_matcher.compile()
+
+        if field_matcher.field is None:
+            # Keyword search: a row matches if any of its values does
+            mask = np.zeros(self.event_count, dtype=bool)
+            for field, values in self._values.items():
+                lookup_table = np.array(
+                    [check({field: value}) for value in values] + [False], dtype=bool
+                )
+                mask |= lookup_table[self.codes(field)]
+            return mask
+
+        field = field_matcher.field
+        values = self._values.get(field, [])
+        # The extra last entry holds the result for a missing field, which
+        # code -1 selects
+        lookup_table = np.array(
+            [check({field: value}) for value in values] + [check({})], dtype=bool
+        )
+        return lookup_table[self.codes(field)]
+
+    def _selection_mask(self, groups):
+        mask = np.zeros(self.event_count, dtype=bool)
+        for group in groups:
+            group_mask = np.ones(self.event_count, dtype=bool)
+            for field_matcher in group:
+                group_mask &= self._field_mask(field_matcher)
+            mask |= group_mask
+        return mask
+
+    def _condition_mask(self, node, selections: dict):
+        operator = node[0]
+        if operator == "sel":
+            return self._selection_mask(selections[node[1]])
+        if operator == "not":
+            return ~self._condition_mask(node[1], selections)
+
+        masks = [self._condition_mask(child, selections) for child in node[1]]
+        if operator == "and":
+            return np.logical_and.reduce(masks)
+        return np.logical_or.reduce(masks)
+
+    def match_mask(self, rule):
+        """
+        Evaluate a compiled rule over every stored event.
+
+        Args:
+            rule: Compiled sigma_matcher.SigmaRule
+
+        Returns:
+            numpy.ndarray: Boolean mask with one entry per stored event
+        """
+        return self._condition_mask(rule.condition, rule.selections)
+
+    def count_matches(self, rule):
+        """Return how many stored events the rule matches."""
+        return int(np.count_nonzero(self.match_mask(rule)))
+
+    def event(self, row: int):
+        """Rebuild the field dictionary of a single stored event."""
+        event = {}
+        for field, values in self._values.items():
+            code = self.codes(field)[row]
+            if code >= 0:
+                event[field] = values[code]
+        return event
+
+
+def find_xml_files(path):
+    """Return the Sysmon XML files at path (a file or a folder of .xml files)."""
+    path = Path(path)
+    if path.is_dir():
+        return sorted(path.glob("*.xml"))
+    return [path]
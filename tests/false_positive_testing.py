@@ -6,7 +6,20 @@ import yaml
 import argparse
 import glob
 from pathlib import Path
-from detection_testing_manager import DetectionTestingManager
+from detection_testing_manager import (
+    DetectionTestingManager,
+    make_event_host,
+    make_run_id,
+    scope_search,
+)
+from sigma_conversion import (
+    UNTAGGED_RULE,
+    combined_rule_search,
+    convert_sigma_rules,
+    is_event_search,
+    rule_key,
+)
+from sigma_matcher import compile_rule
 
 
 def load_environment_variables():
@@ -58,10 +71,19 @@ def load_sigma_detection(file_path):
 
 
 def test_detection(detection_manager, detection_data, file_name, file_path, 
-                   skip_cleanup=False):
-    """Test a single detection using the DetectionTestingManager."""
+                   skip_cleanup=False, earliest_time=None, latest_time=None,
+                   event_host=None):
+    """
+    Test a single detection using the DetectionTestingManager.
+    
+    earliest_time/latest_time optionally bound the benign search window.
+    The attack data is sent, and cleaned up, under its own event_host tag.
+    """
     print(f"\n--- Testing detection: {file_name} ---")
     
+    if event_host is None:
+        event_host = make_event_host(make_run_id())
+    
     try:
         # Check if detection has data file to send
         data_file = detection_data.get('data')
@@ -84,7 +106,8 @@ def test_detection(detection_manager, detection_data, file_name, file_path,
                 file_path=str(data_file_path),
                 source=source,
                 sourcetype=sourcetype,
-                host=detection_manager.conn.host  # Use the Splunk host
+                host=detection_manager.conn.host,  # Use the Splunk host
+                event_host=event_host,
             )
             print("✅ Attack data sent successfully")
             
@@ -99,7 +122,9 @@ def test_detection(detection_manager, detection_data, file_name, file_path,
         print(f"Generated Splunk search: {splunk_search}")
         
         # Run the detection
-        result = detection_manager.run_detection(splunk_search)
+        result = detection_manager.run_detection(
+            splunk_search, earliest_time=earliest_time, latest_time=latest_time
+        )
         
         # For false positive testing: no results = success, results = false positive
         if result:
@@ -112,7 +137,7 @@ def test_detection(detection_manager, detection_data, file_name, file_path,
         # Clean up attack data after testing (unless skip_cleanup is True)
         if data_file and not skip_cleanup:
             print("🧹 Cleaning up attack data...")
-            detection_manager.delete_attack_data()
+            detection_manager.delete_attack_data(event_host=event_host)
             print("✅ Attack data cleaned up")
         
         return detection_result
@@ -122,13 +147,148 @@ def test_detection(detection_manager, detection_data, file_name, file_path,
         # Try to clean up data even if there was an error (unless skip_cleanup)
         try:
             if detection_data.get('data') and not skip_cleanup:
-                detection_manager.delete_attack_data()
+                detection_manager.delete_attack_data(event_host=event_host)
                 print("✅ Attack data cleaned up after error")
         except Exception:
             pass
         return False
 
 
+def run_combined_false_positive_tests(yaml_files, detection_manager,
+                                      earliest_time=None, latest_time=None):
+    """
+    Test every detection against index=benign with one combined search.
+    
+    All rules are OR-ed into a single search that tags each benign event
+    with the ids of the rules it matches, so the benign data is read once
+    per run instead of once per rule. Rules whose search has pipes can't
+    be combined and are run on their own.
+    
+    Returns:
+        tuple: (successful_tests, failed_tests)
+    """
+    successful_tests = 0
+    failed_tests = 0
+    
+    file_names = {}
+    detections = []
+    for yaml_file in yaml_files:
+        file_name = Path(yaml_file).name
+        detection_data = load_sigma_detection(yaml_file)
+        if detection_data is None:
+            print(f"❌ Skipping {file_name} due to loading errors")
+            failed_tests += 1
+            continue
+        file_names[rule_key(detection_data)] = file_name
+        detections.append(detection_data)
+    
+    searches, errors = convert_sigma_rules(
+        detections, detection_manager.conversion_cache
+    )
+    for key, error in errors.items():
+        print(f"❌ Conversion failed for {file_names.get(key, key)}: {error}")
+        failed_tests += 1
+    
+    combinable = {
+        key: search for key, search in searches.items() if is_event_search(search)
+    }
+    false_positives = {}
+    if combinable:
+        combined_search = scope_search(
+            combined_rule_search(combinable), index="benign"
+        )
+        print(f"\n🔎 Searching index=benign once for {len(combinable)} detections...")
+        false_positives = detection_manager.count_by_rule(
+            combined_search, earliest_time=earliest_time, latest_time=latest_time
+        )
+        untagged = false_positives.pop(UNTAGGED_RULE, 0)
+        if untagged:
+            # These events matched some rule, but searchmatch() couldn't say
+            # which, so they can't be passed over as clean
+            print(f"❌ {untagged} benign event(s) matched the combined search "
+                  f"but no single rule; rerun without --combined to find them")
+            failed_tests += 1
+    
+    for key, search in searches.items():
+        if key in combinable:
+            continue
+        print(f"Searching {file_names[key]} on its own (search has pipes)")
+        if detection_manager.run_detection(
+            scope_search(search, index="benign"),
+            earliest_time=earliest_time,
+            latest_time=latest_time,
+        ):
+            false_positives[key] = 1
+    
+    for key in searches:
+        file_name = file_names[key]
+        if key in false_positives:
+            print(f"❌ Detection {file_name} triggered false positive "
+                  f"({false_positives[key]} event(s))")
+            failed_tests += 1
+        else:
+            print(f"✅ Detection {file_name} passed (no false positives)")
+            successful_tests += 1
+    
+    return successful_tests, failed_tests
+
+
+def run_offline_false_positive_tests(yaml_files, corpus_path):
+    """
+    Sweep every detection over a local benign Sysmon corpus without Splunk.
+    
+    The corpus is loaded once into a ColumnarEventStore holding only the
+    fields the rules reference, then each rule is evaluated over all events
+    with NumPy masks.
+    
+    Returns:
+        tuple: (successful_tests, failed_tests)
+    """
+    # Only --offline-corpus needs NumPy
+    from event_store import ColumnarEventStore, find_xml_files
+    
+    successful_tests = 0
+    failed_tests = 0
+    
+    rules = []
+    for yaml_file in yaml_files:
+        file_name = Path(yaml_file).name
+        detection_data = load_sigma_detection(yaml_file)
+        if detection_data is None:
+            print(f"❌ Skipping {file_name} due to loading errors")
+            failed_tests += 1
+            continue
+        try:
+            rules.append((file_name, compile_rule(detection_data)))
+        except Exception as e:
+            print(f"❌ Error compiling detection {file_name}: {e}")
+            failed_tests += 1
+    
+    fields = set()
+    for _, rule in rules:
+        if rule.fields is None:
+            fields = None
+            break
+        fields |= rule.fields
+    
+    corpus_files = find_xml_files(corpus_path)
+    print(f"Loading benign corpus from {len(corpus_files)} file(s)...")
+    store = ColumnarEventStore.from_files(corpus_files, fields)
+    print(f"Loaded {len(store)} benign events")
+    
+    for file_name, rule in rules:
+        print(f"\n--- Testing detection offline: {file_name} ---")
+        false_positives = store.count_matches(rule)
+        if false_positives:
+            print(f"❌ Detection {file_name} matched {false_positives} benign event(s)")
+            failed_tests += 1
+        else:
+            print(f"✅ Detection {file_name} passed (no false positives)")
+            successful_tests += 1
+    
+    return successful_tests, failed_tests
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Test sigma detection rules for false positives using Splunk",
@@ -145,6 +305,15 @@ Example usage:
   # Skip automatic cleanup
   python false_positive_testing.py --no-cleanup /path/to/detections/folder
   
+  # Only search the last week of benign data
+  python false_positive_testing.py --earliest -7d@d --latest now /path/to/detections/folder
+  
+  # Test all detections with a single search over the benign index
+  python false_positive_testing.py --combined /path/to/detections/folder
+  
+  # Sweep a local benign Sysmon XML corpus instead of Splunk
+  python false_positive_testing.py --offline-corpus /path/to/benign/xml /path/to/detections/folder
+  
   # Set environment variables first:
   export SPLUNK_HOST="192.168.1.100"
   export SPLUNK_USERNAME="admin" 
@@ -155,6 +324,7 @@ Note: Tests detections against index=test1 (non-malicious data).
       Failure = >0 results (false positives detected)
       Attack data is automatically sent and cleaned up for each detection.
       Use --no-cleanup to preserve test data in Splunk for analysis.
+      --offline-corpus needs no environment variables.
         """
     )
     
@@ -169,51 +339,101 @@ Note: Tests detections against index=test1 (non-malicious data).
         help='Skip automatic cleanup of test data after each detection'
     )
     
+    parser.add_argument(
+        '--first-match',
+        action='store_true',
+        help="Stop each search at its first false positive ('| head 1')"
+    )
+    
+    parser.add_argument(
+        '--earliest',
+        help='Earliest time of the benign data to search, e.g. -7d@d or an epoch time'
+    )
+    
+    parser.add_argument(
+        '--latest',
+        help='Latest time of the benign data to search, e.g. now or an epoch time'
+    )
+    
+    parser.add_argument(
+        '--combined',
+        action='store_true',
+        help='Test all detections with one combined search over index=benign'
+    )
+    
+    parser.add_argument(
+        '--offline-corpus',
+        help='Sysmon XML file or folder of benign events to test against locally'
+    )
+    
     args = parser.parse_args()
     
     try:
-        # Load environment variables
-        print("Loading environment variables...")
-        env_vars = load_environment_variables()
-        print(f"Connecting to Splunk host: {env_vars['host']}")
-        
-        # Initialize DetectionTestingManager
-        detection_manager = DetectionTestingManager(
-            host=env_vars['host'],
-            username=env_vars['username'],
-            password=env_vars['password']
-        )
+        if args.offline_corpus:
+            # Find YAML files
+            print(f"Searching for YAML files in: {args.folder_path}")
+            yaml_files = find_yaml_files(args.folder_path)
+            print(f"Found {len(yaml_files)} YAML files")
+            
+            successful_tests, failed_tests = run_offline_false_positive_tests(
+                yaml_files, args.offline_corpus
+            )
+        else:
+            # Load environment variables
+            print("Loading environment variables...")
+            env_vars = load_environment_variables()
+            print(f"Connecting to Splunk host: {env_vars['host']}")
         
-        # Configure HEC
-        print("Configuring HTTP Event Collector...")
-        detection_manager.configure_hec()
-        print("HEC configured successfully")
+            # Initialize DetectionTestingManager
+            detection_manager = DetectionTestingManager(
+                host=env_vars['host'],
+                username=env_vars['username'],
+                password=env_vars['password'],
+                first_match=args.first_match,
+            )
         
-        # Find YAML files
-        print(f"\nSearching for YAML files in: {args.folder_path}")
-        yaml_files = find_yaml_files(args.folder_path)
-        print(f"Found {len(yaml_files)} YAML files")
+            # Find YAML files
+            print(f"\nSearching for YAML files in: {args.folder_path}")
+            yaml_files = find_yaml_files(args.folder_path)
+            print(f"Found {len(yaml_files)} YAML files")
         
-        # Test each detection
-        successful_tests = 0
-        failed_tests = 0
+            # Test each detection
+            successful_tests = 0
+            failed_tests = 0
         
-        for yaml_file in yaml_files:
-            file_name = Path(yaml_file).name
-            print(f"\nLoading detection from: {file_name}")
+            if args.combined:
+                successful_tests, failed_tests = run_combined_false_positive_tests(
+                    yaml_files,
+                    detection_manager,
+                    earliest_time=args.earliest,
+                    latest_time=args.latest,
+                )
+            else:
+                # Only the per-rule path sends data; --combined never needs HEC
+                print("Configuring HTTP Event Collector...")
+                detection_manager.configure_hec()
+                print("HEC configured successfully")
+                
+                run_id = make_run_id()
+                for yaml_file in yaml_files:
+                    file_name = Path(yaml_file).name
+                    print(f"\nLoading detection from: {file_name}")
             
-            detection_data = load_sigma_detection(yaml_file)
-            if detection_data is None:
-                print(f"❌ Skipping {file_name} due to loading errors")
-                failed_tests += 1
-                continue
+                    detection_data = load_sigma_detection(yaml_file)
+                    if detection_data is None:
+                        print(f"❌ Skipping {file_name} due to loading errors")
+                        failed_tests += 1
+                        continue
             
-            # Test the detection
-            if test_detection(detection_manager, detection_data, file_name, 
-                              yaml_file, args.no_cleanup):
-                successful_tests += 1
-            else:
-                failed_tests += 1
+                    # Test the detection
+                    if test_detection(detection_manager, detection_data, file_name, 
+                                      yaml_file, args.no_cleanup,
+                                      earliest_time=args.earliest,
+                                      latest_time=args.latest,
+                                      event_host=make_event_host(run_id)):
+                        successful_tests += 1
+                    else:
+                        failed_tests += 1
         
         # Summary
         print(f"\n{'='*50}")
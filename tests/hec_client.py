@@ -0,0 +1,286 @@
+import bisect
+import gzip
+import json
+import os
+import random
+import tempfile
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import disable_warnings
+from urllib3.util.retry import Retry
+
+
+# HEC response code for a token the collector does not recognise
+HEC_INVALID_TOKEN = 4
+
+
+def backoff_delays(initial: float, max_delay: float, factor: float = 2.0,
+                   jitter: float = 0.0):
+    """
+    Yield exponentially growing sleep intervals, capped at max_delay.
+
+    With jitter > 0 each interval is drawn uniformly from
+    [delay * (1 - jitter), delay], so concurrent pollers spread out.
+    """
+    delay = initial
+    while True:
+        yield random.uniform(delay * (1 - jitter), delay) if jitter else delay
+        delay = min(delay * factor, max_delay)
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of latencies in seconds."""
+
+    DEFAULT_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets: Ascending upper bounds of the buckets, in seconds
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        """Add another histogram with the same buckets into this one."""
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+        """Return a printable multi-line summary of the distribution."""
+        if not self.count:
+            return "no samples"
+
+        lines = [
+            f"{self.count} samples, mean {self.total / self.count * 1000:.0f}ms, "
+            f"max {self.max * 1000:.0f}ms"
+        ]
+        lower = 0
+        for upper, count in zip(self.buckets + (None,), self.counts):
+            if count:
+                label = f"<= {upper:g}s" if upper is not None else f"> {lower:g}s"
+                lines.append(f"  {label:>9}: {count}")
+            lower = upper
+        return "\n".join(lines)
+
+
+class HecTokenCache:
+    """
+    On-disk cache of HEC tokens per Splunk host, valid for a limited time.
+
+    Lets separate test runs (or CI jobs sharing a workspace) skip the REST
+    lookup of the DETECTION_TESTING_HEC input. The file is only readable by
+    its owner, since it holds credentials.
+    """
+
+    def __init__(self, path: str, ttl: float = 3600.0):
+        """
+        Args:
+            path: JSON file holding the cached tokens
+            ttl: Seconds a cached token is trusted before being looked up again
+        """
+        self.path = path
+        self.ttl = ttl
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, host: str):
+        """Return the cached token for host, or None if missing or expired."""
+        entry = self._load().get(host)
+        if not isinstance(entry, dict) or "token" not in entry:
+            return None
+        if time.time() - entry.get("saved_at", 0) > self.ttl:
+            return None
+        return entry["token"]
+
+    def set(self, host: str, token: str):
+        """Store the token for host, writing the file atomically."""
+        self._update(host, {"token": token, "saved_at": time.time()})
+
+    def invalidate(self, host: str):
+        """Forget the token for host, e.g. after HEC rejected it."""
+        self._update(host, None)
+
+    def _update(self, host: str, entry):
+        entries = self._load()
+        if entry is None:
+            if entries.pop(host, None) is None:
+                return
+        else:
+            entries[host] = entry
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", dir=directory, suffix=".tmp", delete=False, encoding="utf-8",
+            ) as temp_file:
+                json.dump(entries, temp_file)
+            os.chmod(temp_file.name, 0o600)
+            os.replace(temp_file.name, self.path)
+        except OSError as e:
+            # The in-memory token still works; only later runs lose the cache
+            print(f"Warning: could not write HEC token cache {self.path}: {e}")
+
+
+class HecClient:
+    """
+    Long-lived, connection-pooled client for the Splunk HTTP Event Collector.
+
+    One requests.Session keeps TCP/TLS connections to the collector open
+    across uploads and ack polls. Connection failures and 503 (server busy)
+    responses are retried with backoff; read errors are not, because the
+    collector may already have accepted the payload.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 8088,
+        verify_ssl: bool = False,
+        pool_size: int = 10,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeout: float = 30.0,
+    ):
+        """
+        Args:
+            host: Splunk HEC host
+            port: Splunk HEC port
+            verify_ssl: Verify the collector's TLS certificate
+            pool_size: Maximum number of pooled connections to the collector
+            retries: Retries for connection errors and 503 responses
+            backoff_factor: Backoff factor between retries, in seconds
+            timeout: Connect and read timeout for each request, in seconds
+        """
+        if verify_ssl is False:
+            disable_warnings()
+
+        self.base_url = f"https://{host}:{port}"
+        self.verify_ssl = verify_ssl
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(503,),
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.verify = verify_ssl
+
+    def _url(self, path: str):
+        return urllib.parse.urljoin(self.base_url, path)
+
+    @staticmethod
+    def _headers(token: str, channel: str, compress: bool = False):
+        headers = {
+            "Authorization": f"Splunk {token}",
+            "X-Splunk-Request-Channel": channel,
+        }
+        if compress:
+            headers["Content-Encoding"] = "gzip"
+        return headers
+
+    @staticmethod
+    def _body(data, compress: bool):
+        if not compress:
+            return data
+        if not isinstance(data, bytes):
+            data = b"".join(data)
+        return gzip.compress(data, compresslevel=6)
+
+    def post_raw(self, token: str, channel: str, data, params: dict,
+                 compress: bool = False):
+        """
+        Send a raw payload to /services/collector/raw.
+
+        Args:
+            token: HEC token
+            channel: HEC request channel (required with indexer acknowledgement)
+            data: bytes, file object or generator of bytes
+            params: Query parameters such as index, source, sourcetype, host
+            compress: Send the payload gzip-compressed
+
+        Returns:
+            dict: Decoded JSON response from the collector
+        """
+        res = self.session.post(
+            self._url("services/collector/raw"),
+            params=params,
+            data=self._body(data, compress),
+            headers=self._headers(token, channel, compress),
+            timeout=self.timeout,
+        )
+        return res.json()
+
+    def post_events(self, token: str, channel: str, data, compress: bool = False):
+        """
+        Send a batch of JSON event objects to /services/collector/event.
+
+        Args:
+            token: HEC token
+            channel: HEC request channel (required with indexer acknowledgement)
+            data: Concatenated JSON event objects (bytes or generator of bytes),
+                each carrying its own index/source/sourcetype/host/time
+            compress: Send the payload gzip-compressed
+
+        Returns:
+            dict: Decoded JSON response from the collector
+        """
+        res = self.session.post(
+            self._url("services/collector/event"),
+            data=self._body(data, compress),
+            headers=self._headers(token, channel, compress),
+            timeout=self.timeout,
+        )
+        return res.json()
+
+    def query_acks(self, token: str, channel: str, ack_ids):
+        """
+        Ask /services/collector/ack for the status of ackIds.
+
+        Returns:
+            dict: Decoded JSON response, e.g. {"acks": {"0": true}}
+        """
+        res = self.session.post(
+            self._url("services/collector/ack"),
+            json={"acks": list(ack_ids)},
+            headers=self._headers(token, channel),
+            timeout=self.timeout,
+        )
+        return res.json()
+
+    def close(self):
+        """Close every pooled connection."""
+        self.session.close()
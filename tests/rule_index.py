@@ -0,0 +1,209 @@
+from collections import deque
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton for finding many literals in one pass over a string.
+
+    Literals are matched case-sensitively; callers lowercase both the
+    literals and the scanned text for case-insensitive matching.
+    """
+
+    def __init__(self, literals):
+        """
+        Args:
+            literals: Iterable of non-empty strings to search for
+        """
+        self.literals = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for literal in dict.fromkeys(literals):
+            self._insert(literal)
+        self._build_fail_links()
+
+    def _insert(self, literal: str):
+        literal_id = len(self.literals)
+        self.literals.append(literal)
+
+        state = 0
+        for char in literal:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(literal_id)
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state].extend(self._output[self._fail[next_state]])
+
+    def search(self, text: str):
+        """Return the set of literal ids that occur anywhere in text."""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+def _best_anchor_set(anchor_sets):
+    """Pick the most selective anchor set among AND-ed alternatives."""
+    candidates = [anchors for anchors in anchor_sets if anchors]
+    if not candidates:
+        return None
+    # Fewer, longer literals make a rarer hit
+    return max(
+        candidates,
+        key=lambda anchors: (min(len(literal) for _, literal in anchors), -len(anchors)),
+    )
+
+
+def _union_anchor_sets(anchor_sets):
+    """Union OR-ed anchor sets; any unanchored branch leaves the whole OR unanchored."""
+    if any(anchors is None for anchors in anchor_sets):
+        return None
+    return frozenset().union(*anchor_sets)
+
+
+def field_matcher_anchors(field_matcher):
+    """Anchor literals of one FieldMatcher, or None if it can match without any."""
+    if field_matcher.field is None:
+        return None
+
+    anchors = [
+        (field_matcher.field, pattern.anchor) for pattern in field_matcher.patterns
+    ]
+    present = [anchor for anchor in anchors if anchor[1]]
+
+    if field_matcher.match_all:
+        if not present:
+            return None
+        return frozenset([max(present, key=lambda anchor: len(anchor[1]))])
+
+    if len(present) != len(anchors):
+        return None
+    return frozenset(present)
+
+
+def condition_anchors(node, selections: dict):
+    """
+    Compute a set of (field, literal) pairs at least one of which must occur.
+
+    If a rule matches an event, some literal in the returned set is a
+    substring of the (lowercased) value of its field. Returns None when no
+    such guarantee can be derived, e.g. for a bare 'not' or a regex-only
+    selection.
+    """
+    operator = node[0]
+    if operator == "sel":
+        return _union_anchor_sets([
+            _best_anchor_set([field_matcher_anchors(fm) for fm in group])
+            for group in selections[node[1]]
+        ])
+    if operator == "not":
+        return None
+
+    child_anchors = [condition_anchors(child, selections) for child in node[1]]
+    if operator == "and":
+        return _best_anchor_set(child_anchors)
+    return _union_anchor_sets(child_anchors)
+
+
+class RuleIndex:
+    """
+    Match events against many compiled rules with one automaton pass per field.
+
+    Every contains/startswith/endswith/equals literal that a rule requires is
+    loaded into a per-field Aho-Corasick automaton. Scanning an event's field
+    values once yields the rules whose required literals occur, and only
+    those (plus rules with no required literal) run their full predicate.
+    """
+
+    def __init__(self, rules=()):
+        """
+        Args:
+            rules: Iterable of compiled sigma_matcher.SigmaRule objects
+        """
+        self.rules = []
+        self._automata = None
+        for rule in rules:
+            self.add(rule)
+
+    @property
+    def fields(self):
+        """Union of the fields the indexed rules read, or None if any needs all."""
+        fields = set()
+        for rule in self.rules:
+            if rule.fields is None:
+                return None
+            fields |= rule.fields
+        return fields
+
+    def add(self, rule):
+        """Add a compiled rule; the automata are rebuilt on the next match."""
+        self.rules.append(rule)
+        self._automata = None
+
+    def _build(self):
+        field_literals = {}
+        self._unanchored = set()
+
+        for position, rule in enumerate(self.rules):
+            anchors = condition_anchors(rule.condition, rule.selections)
+            if not anchors:
+                self._unanchored.add(position)
+                continue
+            for field, literal in anchors:
+                field_literals.setdefault(field, {}).setdefault(literal, []).append(
+                    position
+                )
+
+        self._automata = {}
+        for field, literal_rules in field_literals.items():
+            automaton = AhoCorasick(literal_rules)
+            rules_by_literal_id = [
+                literal_rules[literal] for literal in automaton.literals
+            ]
+            self._automata[field] = (automaton, rules_by_literal_id)
+
+    def candidates(self, event: dict):
+        """Return the rules that could match the event, in insertion order."""
+        if self._automata is None:
+            self._build()
+
+        hits = set(self._unanchored)
+        for field, (automaton, rules_by_literal_id) in self._automata.items():
+            value = event.get(field)
+            if not value:
+                continue
+            for literal_id in automaton.search(value.lower()):
+                hits.update(rules_by_literal_id[literal_id])
+
+        return [self.rules[position] for position in sorted(hits)]
+
+    def match(self, event: dict):
+        """Return the rules whose full condition matches the event."""
+        return [rule for rule in self.candidates(event) if rule.matches(event)]
@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import tempfile
+from importlib import metadata
+from pathlib import Path
+
+from sigma.collection import SigmaCollection
+from sigma.backends.splunk import SplunkBackend
+
+
+DEFAULT_CACHE_DIR = os.environ.get("SIGMA_CONVERSION_CACHE", ".sigma_cache")
+
+# rule_field value for events a combined search selected but could not tag
+UNTAGGED_RULE = "__untagged__"
+
+
+def _package_version(name: str):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+class ConversionCache:
+    """
+    Persistent cache of Sigma-to-SPL conversions.
+
+    Entries are keyed by a hash of the normalized rule dictionary together
+    with the installed pySigma and Splunk backend versions, so an unchanged
+    rule is converted once and reused across test runs, deploys and CI jobs,
+    while a pySigma upgrade invalidates everything.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        """
+        Args:
+            cache_dir: Directory holding one JSON file per cached conversion
+        """
+        self.cache_dir = Path(cache_dir)
+        self.versions = {
+            "pysigma": _package_version("pysigma"),
+            "pysigma-backend-splunk": _package_version("pysigma-backend-splunk"),
+        }
+        self._memory = {}
+
+    def key(self, sigma_detection: dict):
+        """Return the cache key for a rule under the installed pySigma versions."""
+        normalized = json.dumps(
+            {"rule": sigma_detection, "versions": self.versions},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str):
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str):
+        """Return the cached SPL for key, or None on a miss."""
+        if key in self._memory:
+            return self._memory[key]
+
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as cache_file:
+                splunk_search = json.load(cache_file)["search"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+        self._memory[key] = splunk_search
+        return splunk_search
+
+    def set(self, key: str, splunk_search: str):
+        """Store the SPL for key, writing the file atomically."""
+        self._memory[key] = splunk_search
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", dir=self.cache_dir, suffix=".tmp", delete=False,
+                encoding="utf-8",
+            ) as temp_file:
+                json.dump({"search": splunk_search}, temp_file)
+            os.replace(temp_file.name, self._path(key))
+        except OSError as e:
+            # A read-only or full disk only costs us the on-disk copy
+            print(f"Warning: could not write conversion cache entry {key}: {e}")
+
+
+def convert_sigma_to_splunk(sigma_detection: dict, cache: ConversionCache = None):
+    """
+    Convert a Sigma detection to a Splunk search, reusing cached conversions.
+
+    Args:
+        sigma_detection: Dictionary containing Sigma detection rule
+        cache: Optional ConversionCache; conversions are not cached if None
+
+    Returns:
+        str: Splunk search query
+    """
+    key = None
+    if cache is not None:
+        key = cache.key(sigma_detection)
+        splunk_search = cache.get(key)
+        if splunk_search is not None:
+            return splunk_search
+
+    sigma_collection = SigmaCollection.from_dicts([sigma_detection])
+    splunk_backend = SplunkBackend()
+    splunk_search = splunk_backend.convert(sigma_collection)[0]
+
+    if cache is not None:
+        cache.set(key, splunk_search)
+    return splunk_search
+
+
+def rule_key(sigma_detection: dict):
+    """Identify a rule by its Sigma id, falling back to its title."""
+    return str(sigma_detection.get("id") or sigma_detection.get("title"))
+
+
+def convert_sigma_rules(sigma_detections, cache: ConversionCache = None):
+    """
+    Convert many Sigma detections to Splunk searches in one batch.
+
+    Cached rules are served from the cache; the rest are loaded into a
+    single SigmaCollection and converted with one shared SplunkBackend, so
+    backend setup and pipeline resolution are paid once per batch. A rule
+    that fails to parse or convert is reported in the errors mapping and
+    does not abort the batch.
+
+    Args:
+        sigma_detections: Iterable of dictionaries containing Sigma rules
+        cache: Optional ConversionCache to read from and populate
+
+    Returns:
+        tuple: (searches, errors) dictionaries keyed by rule id, mapping to
+            the Splunk search and to the error message respectively
+    """
+    searches = {}
+    errors = {}
+    pending = []
+    seen = set()
+
+    for sigma_detection in sigma_detections:
+        key = rule_key(sigma_detection)
+        if key in seen:
+            errors[key] = f"Duplicate rule id {key}"
+            continue
+        seen.add(key)
+
+        # Collection actions, filters and correlations don't map one-to-one
+        # onto converted rules, which the batch relies on below
+        if any(name in sigma_detection for name in ("action", "filter", "correlation")):
+            errors[key] = "Only detection rules can be batch converted"
+            continue
+
+        cache_key = cache.key(sigma_detection) if cache is not None else None
+        splunk_search = cache.get(cache_key) if cache is not None else None
+        if splunk_search is not None:
+            searches[key] = splunk_search
+        else:
+            pending.append((key, cache_key, sigma_detection))
+
+    if not pending:
+        return searches, errors
+
+    try:
+        sigma_collection = SigmaCollection.from_dicts(
+            [sigma_detection for _, _, sigma_detection in pending],
+            collect_errors=True,
+        )
+    except Exception as e:
+        for key, _, _ in pending:
+            errors[key] = f"Could not load rule collection: {e}"
+        return searches, errors
+
+    splunk_backend = SplunkBackend()
+    # Every pending dict is a plain rule, so collection.rules is in input order
+    for (key, cache_key, _), sigma_rule in zip(pending, sigma_collection.rules):
+        if sigma_rule.errors:
+            errors[key] = "; ".join(str(error) for error in sigma_rule.errors)
+            continue
+
+        try:
+            splunk_search = splunk_backend.convert_rule(sigma_rule)[0]
+        except Exception as e:
+            errors[key] = str(e)
+            continue
+
+        searches[key] = splunk_search
+        if cache is not None:
+            cache.set(cache_key, splunk_search)
+
+    return searches, errors
+
+
+def is_event_search(splunk_search: str):
+    """
+    Tell whether a converted search is a plain event filter without pipes.
+
+    Only such searches can be OR-ed together and re-checked with
+    searchmatch(); pipes inside quoted values don't count.
+    """
+    quoted = False
+    escaped = False
+    for char in splunk_search.strip():
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char == "|" and not quoted:
+            return False
+    return True
+
+
+def eval_string(value: str):
+    """Quote a value as an eval string literal."""
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def combined_rule_search(searches: dict, rule_field: str = "rule_id"):
+    """
+    Combine many rules' searches into one that tags events with matching rules.
+
+    The combined search selects every event matching any rule, then sets
+    rule_field to the multivalue list of the ids of the rules each event
+    matches, so the data is read once however many rules there are. Callers
+    add their own index/host filters (e.g. with scope_search) and
+    aggregation, such as '| stats count by rule_id'.
+
+    searchmatch() is not the search command's parser, so an event could be
+    selected but match no clause when re-checked; such events get
+    UNTAGGED_RULE instead of a null rule_field, which stats would drop.
+
+    Args:
+        searches: Mapping of rule id to converted Splunk search; every
+            search must satisfy is_event_search
+        rule_field: Name of the field holding the matching rule ids
+
+    Returns:
+        str: Splunk search
+    """
+    clauses = []
+    tags = []
+    for key, splunk_search in searches.items():
+        splunk_search = splunk_search.strip()
+        if splunk_search.startswith("search "):
+            splunk_search = splunk_search[7:].strip()
+        if not is_event_search(splunk_search):
+            raise ValueError(f"Search for {key} has pipes and cannot be combined")
+
+        clauses.append(f"({splunk_search})")
+        tags.append(
+            f"if(searchmatch({eval_string(splunk_search)}), "
+            f"{eval_string(key)}, null())"
+        )
+
+    return (
+        f"({' OR '.join(clauses)}) "
+        f"| eval {rule_field}=mvappend({', '.join(tags)}) "
+        f"| fillnull value={eval_string(UNTAGGED_RULE)} {rule_field}"
+    )
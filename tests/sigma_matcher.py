@@ -0,0 +1,521 @@
+import hashlib
+import json
+import re
+
+
+SUPPORTED_MODIFIERS = {"contains", "startswith", "endswith", "all", "re", "cased"}
+
+CONDITION_TOKEN_PATTERN = re.compile(r"\(|\)|[^\s()]+")
+
+WILDCARD_MULTI = object()
+WILDCARD_SINGLE = object()
+
+
+class SigmaMatchError(Exception):
+    """Raised when a Sigma rule uses syntax the offline matcher cannot evaluate."""
+
+
+def split_sigma_string(value: str):
+    """
+    Split a Sigma string value into literal chunks and wildcards.
+
+    Follows the Sigma escaping rules: '*' and '?' are wildcards, '\\*', '\\?'
+    and '\\\\' are escaped literals, and any other backslash is kept as-is
+    (so '\\attrib.exe' stays a literal backslash path).
+
+    Returns:
+        list: str chunks interleaved with WILDCARD_MULTI / WILDCARD_SINGLE
+    """
+    tokens = []
+    literal = []
+    i = 0
+
+    while i < len(value):
+        char = value[i]
+        if char == "\\" and i + 1 < len(value) and value[i + 1] in "*?\\":
+            literal.append(value[i + 1])
+            i += 2
+            continue
+
+        if char in "*?":
+            if literal:
+                tokens.append("".join(literal))
+                literal = []
+            tokens.append(WILDCARD_MULTI if char == "*" else WILDCARD_SINGLE)
+        else:
+            literal.append(char)
+        i += 1
+
+    if literal:
+        tokens.append("".join(literal))
+    return tokens
+
+
+class ValuePattern:
+    """A single Sigma value prepared for one match mode."""
+
+    def __init__(self, value, mode: str = "equals", cased: bool = False):
+        """
+        Args:
+            value: Sigma value (str, int, bool or None)
+            mode: One of equals, contains, startswith, endswith, re
+            cased: Match case-sensitively (Sigma 'cased' modifier)
+        """
+        self.value = value
+        self.mode = mode
+        self.cased = cased
+        self.literal = None
+        self.regex = None
+        # Lowercased substring every matching value must contain, if any
+        self.anchor = None
+
+        if value is None:
+            return
+
+        if mode == "re":
+            self.regex = re.compile(str(value))
+            return
+
+        tokens = split_sigma_string(str(value))
+        chunks = [token for token in tokens if isinstance(token, str)]
+        if chunks:
+            self.anchor = max(chunks, key=len).lower()
+
+        if len(chunks) == len(tokens):
+            literal = "".join(tokens)
+            self.literal = literal if cased else literal.lower()
+            return
+
+        parts = []
+        for token in tokens:
+            if token is WILDCARD_MULTI:
+                parts.append(".*")
+            elif token is WILDCARD_SINGLE:
+                parts.append(".")
+            else:
+                parts.append(re.escape(token))
+        if mode in ("contains", "endswith"):
+            parts.insert(0, ".*")
+        if mode in ("contains", "startswith"):
+            parts.append(".*")
+
+        flags = re.DOTALL if cased else re.DOTALL | re.IGNORECASE
+        self.regex = re.compile("".join(parts), flags)
+
+    def compile(self):
+        """Return a function of the raw field value that applies this pattern."""
+        if self.value is None:
+            return lambda field_value: field_value is None or field_value == ""
+
+        if self.regex is not None:
+            search = self.regex.search if self.mode == "re" else self.regex.fullmatch
+            return lambda field_value: (
+                field_value is not None and search(field_value) is not None
+            )
+
+        literal = self.literal
+        normalize = (lambda field_value: field_value) if self.cased else str.lower
+        if self.mode == "contains":
+            return lambda field_value: (
+                field_value is not None and literal in normalize(field_value)
+            )
+        if self.mode == "startswith":
+            return lambda field_value: (
+                field_value is not None and normalize(field_value).startswith(literal)
+            )
+        if self.mode == "endswith":
+            return lambda field_value: (
+                field_value is not None and normalize(field_value).endswith(literal)
+            )
+        return lambda field_value: (
+            field_value is not None and normalize(field_value) == literal
+        )
+
+
+class FieldMatcher:
+    """One 'Field|modifiers: values' entry of a Sigma selection."""
+
+    def __init__(self, field_spec, values):
+        """
+        Args:
+            field_spec: Key such as 'CommandLine|contains|all', or None for keywords
+            values: A single value or a list of values
+        """
+        self.field = None
+        modifiers = []
+        if field_spec is not None:
+            self.field, *modifiers = field_spec.split("|")
+        else:
+            # Keyword searches behave like a full-text contains over the event
+            modifiers = ["contains"]
+
+        unsupported = set(modifiers) - SUPPORTED_MODIFIERS
+        if unsupported:
+            raise SigmaMatchError(
+                f"Unsupported modifier(s) {sorted(unsupported)} on field {field_spec}"
+            )
+
+        mode = "equals"
+        for modifier in modifiers:
+            if modifier in ("contains", "startswith", "endswith", "re"):
+                mode = modifier
+
+        self.match_all = "all" in modifiers
+        if not isinstance(values, list):
+            values = [values]
+        self.patterns = [
+            ValuePattern(value, mode, cased="cased" in modifiers)
+            for value in values
+        ]
+
+    def compile(self):
+        """
+        Return a predicate over an event dictionary for this field entry.
+
+        The field name is bound once, and an OR over plain case-insensitive
+        literals lowercases the field value a single time and tests all of
+        them with one set lookup or str.startswith/endswith tuple call.
+        """
+        field = self.field
+
+        if field is None:
+            checks = [pattern.compile() for pattern in self.patterns]
+            return lambda event: any(
+                check(field_value)
+                for field_value in event.values() if field_value
+                for check in checks
+            )
+
+        literal_modes = {pattern.mode for pattern in self.patterns}
+        plain_literals = (
+            not self.match_all
+            and len(literal_modes) == 1
+            and all(
+                pattern.literal is not None and not pattern.cased
+                for pattern in self.patterns
+            )
+        )
+
+        if plain_literals:
+            mode = literal_modes.pop()
+            literals = tuple(pattern.literal for pattern in self.patterns)
+            if mode == "contains":
+                if len(literals) == 1:
+                    literal = literals[0]
+                    return lambda event: (
+                        (value := event.get(field)) is not None
+                        and literal in value.lower()
+                    )
+
+                def contains_any(event):
+                    value = event.get(field)
+                    if value is None:
+                        return False
+                    value = value.lower()
+                    return any(literal in value for literal in literals)
+
+                return contains_any
+            if mode == "startswith":
+                return lambda event: (
+                    (value := event.get(field)) is not None
+                    and value.lower().startswith(literals)
+                )
+            if mode == "endswith":
+                return lambda event: (
+                    (value := event.get(field)) is not None
+                    and value.lower().endswith(literals)
+                )
+            literal_set = frozenset(literals)
+            return lambda event: (
+                (value := event.get(field)) is not None
+                and value.lower() in literal_set
+            )
+
+        checks = [pattern.compile() for pattern in self.patterns]
+        if len(checks) == 1:
+            check = checks[0]
+            return lambda event: check(event.get(field))
+        if self.match_all:
+            return lambda event: all(check(event.get(field)) for check in checks)
+        return lambda event: any(check(event.get(field)) for check in checks)
+
+
+def parse_selection(name: str, definition):
+    """
+    Parse a Sigma detection item into OR-ed groups of AND-ed FieldMatchers.
+
+    A map is a single group, a list of maps is one group per map, and a list
+    of plain values is a keyword search.
+    """
+    if isinstance(definition, dict):
+        return [[FieldMatcher(key, value) for key, value in definition.items()]]
+
+    if isinstance(definition, list):
+        if all(isinstance(item, dict) for item in definition):
+            return [
+                [FieldMatcher(key, value) for key, value in item.items()]
+                for item in definition
+            ]
+        if not any(isinstance(item, (dict, list)) for item in definition):
+            return [[FieldMatcher(None, definition)]]
+
+    raise SigmaMatchError(f"Unsupported definition for detection item '{name}'")
+
+
+class ConditionParser:
+    """
+    Recursive-descent parser for Sigma conditions.
+
+    Produces a tuple AST of ("and", [...]), ("or", [...]), ("not", node) and
+    ("sel", name) nodes, with 'x of pattern' expanded against the rule's
+    detection item names.
+    """
+
+    def __init__(self, condition: str, identifiers):
+        if "|" in condition:
+            raise SigmaMatchError(
+                f"Aggregations are not supported in condition: {condition}"
+            )
+        self.condition = condition
+        self.identifiers = list(identifiers)
+        self.tokens = CONDITION_TOKEN_PATTERN.findall(condition)
+        self.position = 0
+
+    def parse(self):
+        node = self._parse_or()
+        if self.position != len(self.tokens):
+            raise SigmaMatchError(
+                f"Unexpected token '{self.tokens[self.position]}' "
+                f"in condition: {self.condition}"
+            )
+        return node
+
+    def _peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def _next(self):
+        token = self._peek()
+        if token is None:
+            raise SigmaMatchError(f"Unexpected end of condition: {self.condition}")
+        self.position += 1
+        return token
+
+    def _parse_or(self):
+        children = [self._parse_and()]
+        while self._peek() is not None and self._peek().lower() == "or":
+            self._next()
+            children.append(self._parse_and())
+        return children[0] if len(children) == 1 else ("or", children)
+
+    def _parse_and(self):
+        children = [self._parse_not()]
+        while self._peek() is not None and self._peek().lower() == "and":
+            self._next()
+            children.append(self._parse_not())
+        return children[0] if len(children) == 1 else ("and", children)
+
+    def _parse_not(self):
+        if self._peek() is not None and self._peek().lower() == "not":
+            self._next()
+            return ("not", self._parse_not())
+        return self._parse_primary()
+
+    def _parse_primary(self):
+        token = self._next()
+
+        if token == "(":
+            node = self._parse_or()
+            if self._next() != ")":
+                raise SigmaMatchError(f"Unbalanced parentheses in: {self.condition}")
+            return node
+
+        if token.lower() in ("1", "any", "all") and (self._peek() or "").lower() == "of":
+            self._next()
+            names = self._expand(self._next())
+            children = [("sel", name) for name in names]
+            if len(children) == 1:
+                return children[0]
+            return ("and" if token.lower() == "all" else "or", children)
+
+        if token not in self.identifiers:
+            raise SigmaMatchError(
+                f"Unknown detection item '{token}' in condition: {self.condition}"
+            )
+        return ("sel", token)
+
+    def _expand(self, target: str):
+        if target.lower() == "them":
+            names = [name for name in self.identifiers if not name.startswith("_")]
+        else:
+            pattern = re.compile(
+                "".join(".*" if char == "*" else re.escape(char) for char in target)
+            )
+            names = [name for name in self.identifiers if pattern.fullmatch(name)]
+
+        if not names:
+            raise SigmaMatchError(
+                f"'{target}' matches no detection items in: {self.condition}"
+            )
+        return names
+
+
+def _all_of(predicates):
+    """Combine predicates with AND, unrolling the common small cases."""
+    if len(predicates) == 1:
+        return predicates[0]
+    if len(predicates) == 2:
+        first, second = predicates
+        return lambda event: first(event) and second(event)
+    if len(predicates) == 3:
+        first, second, third = predicates
+        return lambda event: first(event) and second(event) and third(event)
+    predicates = tuple(predicates)
+    return lambda event: all(predicate(event) for predicate in predicates)
+
+
+def _any_of(predicates):
+    """Combine predicates with OR, unrolling the common small cases."""
+    if len(predicates) == 1:
+        return predicates[0]
+    if len(predicates) == 2:
+        first, second = predicates
+        return lambda event: first(event) or second(event)
+    if len(predicates) == 3:
+        first, second, third = predicates
+        return lambda event: first(event) or second(event) or third(event)
+    predicates = tuple(predicates)
+    return lambda event: any(predicate(event) for predicate in predicates)
+
+
+def _negate(predicate):
+    return lambda event: not predicate(event)
+
+
+def compile_selection(groups):
+    """Compile OR-ed groups of AND-ed FieldMatchers into one predicate."""
+    return _any_of([
+        _all_of([field_matcher.compile() for field_matcher in group])
+        for group in groups
+    ])
+
+
+def selection_fields(groups):
+    """Return the field names a parsed selection reads, or None for keywords."""
+    fields = set()
+    for group in groups:
+        for field_matcher in group:
+            if field_matcher.field is None:
+                return None
+            fields.add(field_matcher.field)
+    return fields
+
+
+def condition_selections(node):
+    """Return the set of detection item names a condition AST references."""
+    if node[0] == "sel":
+        return {node[1]}
+    if node[0] == "not":
+        return condition_selections(node[1])
+    return set().union(*(condition_selections(child) for child in node[1]))
+
+
+def compile_condition(node, selection_predicates: dict):
+    """Compile a condition AST into one predicate over the compiled selections."""
+    operator = node[0]
+    if operator == "sel":
+        return selection_predicates[node[1]]
+    if operator == "not":
+        return _negate(compile_condition(node[1], selection_predicates))
+
+    children = [compile_condition(child, selection_predicates) for child in node[1]]
+    return _all_of(children) if operator == "and" else _any_of(children)
+
+
+class SigmaRule:
+    """
+    Evaluate a Sigma rule's detection block against parsed events in Python.
+
+    The condition and selections are compiled once into a single predicate
+    function, so matching an event costs one call. Mirrors the plain
+    SplunkBackend conversion used by DetectionTestingManager: the logsource is
+    not turned into extra filters, field names are used as-is and string
+    comparisons are case-insensitive unless 'cased' is given. Events are
+    dictionaries of string values, as produced by sysmon_events.parse_event.
+    """
+
+    def __init__(self, sigma_detection: dict):
+        """
+        Args:
+            sigma_detection: Dictionary containing Sigma detection rule
+        """
+        self.id = sigma_detection.get("id")
+        self.title = sigma_detection.get("title")
+
+        detection = dict(sigma_detection.get("detection") or {})
+        condition = detection.pop("condition", None)
+        if not condition:
+            raise SigmaMatchError(f"Rule {self.title} has no detection condition")
+
+        self.selections = {
+            name: parse_selection(name, definition)
+            for name, definition in detection.items()
+        }
+
+        conditions = condition if isinstance(condition, list) else [condition]
+        nodes = [ConditionParser(text, self.selections).parse() for text in conditions]
+        self.condition = nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+        # Only selections the condition references are compiled
+        selection_predicates = {
+            name: compile_selection(self.selections[name])
+            for name in condition_selections(self.condition)
+        }
+        self.matches = compile_condition(self.condition, selection_predicates)
+
+        # Event fields the rule reads; None when a keyword search needs them all
+        self.fields = set()
+        for name in selection_predicates:
+            fields = selection_fields(self.selections[name])
+            if fields is None:
+                self.fields = None
+                break
+            self.fields |= fields
+
+    def matching_events(self, events):
+        """Return the events that satisfy the rule's condition."""
+        matches = self.matches
+        return [event for event in events if matches(event)]
+
+
+def rule_content_hash(sigma_detection: dict):
+    """Hash the parts of a rule that affect matching (its detection block)."""
+    normalized = json.dumps(
+        sigma_detection.get("detection"), sort_keys=True, default=str
+    )
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+_compiled_rules = {}
+
+
+def compile_rule(sigma_detection: dict):
+    """
+    Return a compiled SigmaRule, reusing it while the rule is unchanged.
+
+    Compiled rules are cached by rule id plus a hash of the detection block,
+    so editing a rule (or reusing an id) recompiles it.
+
+    Args:
+        sigma_detection: Dictionary containing Sigma detection rule
+
+    Returns:
+        SigmaRule: Rule whose matches(event) is a single compiled predicate
+    """
+    key = (sigma_detection.get("id"), rule_content_hash(sigma_detection))
+    rule = _compiled_rules.get(key)
+    if rule is None:
+        rule = SigmaRule(sigma_detection)
+        _compiled_rules[key] = rule
+    return rule
@@ -0,0 +1,211 @@
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+EVENT_END_TAG = b"</Event>"
+
+SYSTEM_TIME_PATTERN = re.compile(
+    rb"<TimeCreated\s+SystemTime=['\"](\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(\.\d+)?Z?['\"]"
+)
+
+
+def _local_name(tag: str):
+    """Strip the XML namespace from an element tag."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_event(element, fields=None):
+    """
+    Flatten a Sysmon <Event> element into a dictionary of field values.
+
+    System fields (EventID, Computer, Channel, ...) are keyed by their tag
+    name, TimeCreated by its SystemTime attribute, and every
+    EventData/Data[@Name] entry by its Name attribute.
+
+    Args:
+        element: xml.etree.ElementTree.Element for a single <Event>
+        fields: Optional set of field names to keep; all fields if None
+
+    Returns:
+        dict: Field name to string value
+    """
+    event = {}
+
+    for child in element:
+        section = _local_name(child.tag)
+
+        if section == "System":
+            for field in child:
+                name = _local_name(field.tag)
+                if name == "TimeCreated":
+                    name, value = "TimeCreated", field.get("SystemTime")
+                elif name == "Provider":
+                    name, value = "Provider_Name", field.get("Name")
+                else:
+                    value = field.text
+                if value is not None and (fields is None or name in fields):
+                    event[name] = value
+
+        elif section == "EventData":
+            for data in child:
+                name = data.get("Name")
+                if name and (fields is None or name in fields):
+                    event[name] = data.text if data.text is not None else ""
+
+    return event
+
+
+def _iter_chunks(file_path: str, chunk_size: int):
+    """Yield the file's bytes in chunks, without a BOM or XML declaration."""
+    with open(file_path, "rb") as datafile:
+        first = True
+        while True:
+            chunk = datafile.read(chunk_size)
+            if not chunk:
+                return
+            if first:
+                first = False
+                chunk = chunk.removeprefix(b"\xef\xbb\xbf").lstrip()
+                if chunk.startswith(b"<?xml"):
+                    declaration_end = chunk.find(b"?>")
+                    while declaration_end == -1:
+                        more = datafile.read(chunk_size)
+                        if not more:
+                            return
+                        chunk += more
+                        declaration_end = chunk.find(b"?>")
+                    chunk = chunk[declaration_end + 2:]
+            yield chunk
+
+
+def iter_raw_events(file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Stream the raw bytes of each <Event>...</Event> record in a Sysmon export.
+
+    Used to replay a file to HEC without loading it into memory. Records are
+    split on the closing </Event> tag, so they may span lines.
+
+    Yields:
+        bytes: One stripped <Event> record at a time
+    """
+    buffer = b""
+    for chunk in _iter_chunks(file_path, chunk_size):
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(EVENT_END_TAG, start)
+            if end == -1:
+                break
+            end += len(EVENT_END_TAG)
+            record = buffer[start:end].strip()
+            if record:
+                yield record
+            start = end
+        buffer = buffer[start:]
+
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def iter_sysmon_events(file_path: str, fields=None,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Stream events from a Sysmon XML export with constant memory.
+
+    The file is read in fixed-size chunks and split into <Event> records,
+    each of which is parsed, flattened and discarded before the next one, so
+    memory use does not grow with the file size.
+
+    Args:
+        file_path: Path to the Sysmon XML file
+        fields: Optional set of field names to extract, e.g. the fields the
+            loaded rules reference; all fields if None
+        chunk_size: Number of bytes read from the file at a time
+
+    Yields:
+        dict: One dictionary per event, as returned by parse_event
+    """
+    for record in iter_raw_events(file_path, chunk_size):
+        yield parse_event(ET.fromstring(record), fields)
+
+
+def iter_event_chunks(file_path: str, max_chunk_bytes: int = DEFAULT_CHUNK_SIZE):
+    """
+    Group a Sysmon export's <Event> records into bounded, newline-joined chunks.
+
+    Chunks always end on an </Event> boundary; a single record larger than
+    max_chunk_bytes is yielded as a chunk of its own.
+
+    Yields:
+        bytes: Up to max_chunk_bytes of complete records
+    """
+    chunk = []
+    chunk_bytes = 0
+    for record in iter_raw_events(file_path):
+        if chunk and chunk_bytes + len(record) + 1 > max_chunk_bytes:
+            yield b"".join(chunk)
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(record + b"\n")
+        chunk_bytes += len(record) + 1
+
+    if chunk:
+        yield b"".join(chunk)
+
+
+def record_time(record: bytes):
+    """
+    Return the TimeCreated SystemTime of a raw <Event> record as epoch seconds.
+
+    Returns:
+        float: Seconds since the epoch (UTC), or None if the record has no
+            TimeCreated stamp
+    """
+    match = SYSTEM_TIME_PATTERN.search(record)
+    if match is None:
+        return None
+
+    timestamp = datetime.strptime(match.group(1).decode(), "%Y-%m-%dT%H:%M:%S")
+    seconds = timestamp.replace(tzinfo=timezone.utc).timestamp()
+    if match.group(2):
+        seconds += float(match.group(2))
+    return seconds
+
+
+def event_summary(file_path: str):
+    """
+    Count the <Event> records of a Sysmon export and find their time range.
+
+    Returns:
+        tuple: (count, earliest, latest), the times as epoch seconds; both
+            times are None when no record carries a TimeCreated stamp
+    """
+    count = 0
+    earliest = latest = None
+    for record in iter_raw_events(file_path):
+        count += 1
+        event_time = record_time(record)
+        if event_time is None:
+            continue
+        if earliest is None or event_time < earliest:
+            earliest = event_time
+        if latest is None or event_time > latest:
+            latest = event_time
+    return count, earliest, latest
+
+
+def read_sysmon_events(file_path: str, fields=None):
+    """
+    Read every event from a Sysmon XML export into a list.
+
+    Args:
+        file_path: Path to the Sysmon XML file
+        fields: Optional set of field names to extract; all fields if None
+
+    Returns:
+        list: One dictionary per event, as returned by parse_event
+    """
+    return list(iter_sysmon_events(file_path, fields))
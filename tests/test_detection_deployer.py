@@ -0,0 +1,176 @@
+from types import SimpleNamespace
+
+import pytest
+
+from detection_deployer import (
+    MANAGED_DESCRIPTION_PREFIX,
+    SCHEDULE_PERIOD,
+    DetectionDeployer,
+    content_hash,
+    cron_minutes,
+    description_content_hash,
+    projected_load,
+    schedule_offset,
+    staggered_cron,
+)
+
+
+@pytest.mark.parametrize("cron_schedule, minutes", [
+    ("*/5 * * * *", set(range(0, 60, 5))),
+    ("3-59/5 * * * *", set(range(3, 60, 5))),
+    ("0-59/15 * * * *", {0, 15, 30, 45}),
+    ("0,15,45 * * * *", {0, 15, 45}),
+    ("7,20-22 * * * *", {7, 20, 21, 22}),
+    ("10 * * * *", {10}),
+    ("10/20 * * * *", {10, 30, 50}),
+    ("* * * * *", set(range(60))),
+])
+def test_cron_minutes(cron_schedule, minutes):
+    assert cron_minutes(cron_schedule) == minutes
+
+
+@pytest.mark.parametrize("offset", range(SCHEDULE_PERIOD))
+def test_staggered_cron_fires_every_period_from_offset(offset):
+    assert staggered_cron(offset) == f"{offset}-59/{SCHEDULE_PERIOD} * * * *"
+    assert cron_minutes(staggered_cron(offset)) == set(
+        range(offset, 60, SCHEDULE_PERIOD)
+    )
+
+
+def test_schedule_offset_is_stable():
+    rule_id = "b91813a1-2952-456f-83af-8aaf88e2ef2e"
+    # Pinned, so a change in the hashing would show up as every deployed
+    # detection being rescheduled
+    assert schedule_offset(rule_id) == 1
+    assert schedule_offset("logsource=process_creation/windows") == schedule_offset(
+        "logsource=process_creation/windows"
+    )
+    assert schedule_offset("x", period=60) == 6
+
+
+def test_schedule_offsets_cover_the_period():
+    offsets = [schedule_offset(f"rule-{i}") for i in range(200)]
+    assert set(offsets) == set(range(SCHEDULE_PERIOD))
+
+
+def test_projected_load():
+    desired = {
+        "a": {"is_scheduled": True, "cron_schedule": staggered_cron(0)},
+        "b": {"is_scheduled": True, "cron_schedule": staggered_cron(0)},
+        "c": {"is_scheduled": True, "cron_schedule": "2,3 * * * *"},
+        "d": {"is_scheduled": False, "cron_schedule": "* * * * *"},
+    }
+    load = projected_load(desired)
+    assert len(load) == 60
+    assert load[0] == load[55] == 2
+    assert load[2] == load[3] == 1
+    assert load[1] == load[4] == load[59] == 0
+    assert sum(load) == 2 * 12 + 2
+
+
+def make_deployer(lab_host="lab8"):
+    # Skip __init__, which connects to Splunk
+    deployer = DetectionDeployer.__new__(DetectionDeployer)
+    deployer.lab_host = lab_host
+    return deployer
+
+
+def deployed(properties, **overrides):
+    """A saved search entity as Splunk reports a deployed one back."""
+    content = {
+        key: ("1" if value is True else "0" if value is False else str(value))
+        for key, value in properties.items()
+    }
+    # Properties the deployer never sets, which must not cause updates
+    content.update({"disabled": "0", "alert.expires": "24h", "action.email.to": None})
+    content.update(overrides)
+    return SimpleNamespace(content=content)
+
+
+RULE = {"id": "rule-1", "title": "Rule one"}
+
+
+def test_content_hash_is_recorded_in_description():
+    properties = make_deployer().saved_search_properties(RULE, "EventID=1")
+    assert properties["description"].startswith(f"{MANAGED_DESCRIPTION_PREFIX} rule-1 ")
+
+    hashed = {key: value for key, value in properties.items() if key != "description"}
+    assert description_content_hash(properties["description"]) == content_hash(hashed)
+    assert description_content_hash("hand-written search") is None
+    assert description_content_hash(None) is None
+
+
+def test_content_hash_matches_splunk_rendering():
+    assert content_hash({"is_scheduled": True, "search": " a "}) == content_hash(
+        {"is_scheduled": "1", "search": "a"}
+    )
+    assert content_hash({"search": "a"}) != content_hash({"search": "b"})
+
+
+def test_plan_sync():
+    deployer = make_deployer()
+    unchanged = deployer.saved_search_properties(RULE, "EventID=1")
+    changed = deployer.saved_search_properties({"id": "rule-2"}, "EventID=2")
+    new = deployer.saved_search_properties({"id": "rule-3"}, "EventID=3")
+    stale = deployer.saved_search_properties({"id": "rule-4"}, "EventID=4")
+
+    desired = {"unchanged": unchanged, "changed": changed, "new": new}
+    existing = {
+        "unchanged": deployed(unchanged),
+        "changed": deployed(changed, search="index=win host=lab8 EventID=22"),
+        "stale": deployed(stale),
+        "hand-written": deployed({"search": "index=main", "description": "mine"}),
+        "no description": deployed({"search": "index=main"}, description=None),
+    }
+
+    plan = deployer.plan_sync(desired, existing)
+    assert plan == {
+        "create": ["new"], "update": ["changed"], "delete": [], "unchanged": ["unchanged"],
+    }
+
+    plan = deployer.plan_sync(desired, existing, prune=True)
+    # Only managed searches whose rule is gone are pruned, never other ones
+    assert plan["delete"] == ["stale"]
+    assert plan["update"] == ["changed"]
+
+
+@pytest.mark.parametrize("key, value", [
+    ("cron_schedule", "*/5 * * * *"),
+    ("is_scheduled", "0"),
+    ("dispatch.earliest_time", "-24h"),
+    ("description", "[sigma-deployer] rule-1 content=0000000000000000"),
+])
+def test_plan_sync_updates_any_changed_property(key, value):
+    deployer = make_deployer()
+    properties = deployer.saved_search_properties(RULE, "EventID=1")
+    plan = deployer.plan_sync(
+        {"rule": properties}, {"rule": deployed(properties, **{key: value})}
+    )
+    assert plan["update"] == ["rule"]
+
+
+def test_plan_sync_updates_after_lab_host_change():
+    properties = make_deployer("lab8").saved_search_properties(RULE, "EventID=1")
+    moved = make_deployer("lab9").saved_search_properties(RULE, "EventID=1")
+    plan = make_deployer().plan_sync({"rule": moved}, {"rule": deployed(properties)})
+    assert plan["update"] == ["rule"]
+
+
+def test_plan_sync_prunes_superseded_legacy_searches():
+    deployer = make_deployer()
+    group = deployer.saved_search_properties({"id": "group"}, "EventID=1")
+    # Deployed before searches carried a managed description
+    legacy = deployed({"search": "index=win host=lab8 EventID=1"})
+    existing = {"rule_a": legacy, "rule_b": legacy, "hand-written": legacy}
+
+    plan = deployer.plan_sync(
+        {"Sigma group - g": group}, existing, superseded={"rule_a", "rule_b"}
+    )
+    assert plan["delete"] == []
+
+    plan = deployer.plan_sync(
+        {"Sigma group - g": group}, existing, prune=True,
+        superseded={"rule_a", "rule_b"},
+    )
+    assert plan["delete"] == ["rule_a", "rule_b"]
+    assert plan["create"] == ["Sigma group - g"]
@@ -4,9 +4,23 @@ import os
 import sys
 import yaml
 import argparse
+import asyncio
 import glob
+import subprocess
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from detection_testing_manager import DetectionTestingManager
+from detection_testing_manager import (
+    DetectionTestingManager,
+    make_event_host,
+    make_run_id,
+)
+from hec_client import HecTokenCache, LatencyHistogram
+from rule_index import RuleIndex
+from sigma_conversion import ConversionCache, convert_sigma_rules
+from sigma_matcher import compile_rule
+from sysmon_events import event_summary, iter_sysmon_events
 
 
 def load_environment_variables():
@@ -57,16 +71,93 @@ def load_sigma_detection(file_path):
         return None
 
 
+def git_changed_files(ref):
+    """
+    Return the absolute paths of files changed since a git ref.
+    
+    Compares the merge base of ref and HEAD against the working tree, so
+    committed, staged, unstaged and untracked changes are all included.
+    """
+    def git(*args):
+        result = subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=True
+        )
+        return result.stdout.splitlines()
+    
+    top_level = Path(git("rev-parse", "--show-toplevel")[0])
+    merge_base = git("merge-base", ref, "HEAD")[0]
+    changed = git("diff", "--name-only", merge_base)
+    changed += git("ls-files", "--others", "--exclude-standard", "--full-name",
+                   str(top_level))
+    return {(top_level / path).resolve() for path in changed}
+
+
+def select_changed_detections(yaml_files, ref):
+    """
+    Keep only the detections affected by changes since a git ref.
+    
+    A detection is selected when its YAML file or its data: fixture changed.
+    Changes to the test harness itself select every detection.
+    """
+    changed = git_changed_files(ref)
+    harness_dir = Path(__file__).resolve().parent
+    if any(harness_dir in path.parents for path in changed):
+        print("Test harness changed, testing all detections")
+        return yaml_files
+    
+    selected = []
+    for yaml_file in yaml_files:
+        yaml_path = Path(yaml_file).resolve()
+        if yaml_path in changed:
+            selected.append(yaml_file)
+            continue
+        
+        detection_data = load_sigma_detection(yaml_file)
+        data_file = detection_data.get('data') if detection_data else None
+        if data_file and (yaml_path.parent / data_file).resolve() in changed:
+            selected.append(yaml_file)
+    
+    return selected
+
+
+def fixture_time_window(earliest, latest, padding=60):
+    """
+    Build earliest/latest search bounds around a fixture's event times.
+    
+    The bounds are padded by padding seconds on each side, so Splunk only
+    opens the buckets that can hold the test events.
+    
+    Returns:
+        tuple: (earliest_time, latest_time) as epoch strings, or (None, None)
+            if the fixture has no TimeCreated stamps
+    """
+    if earliest is None:
+        return None, None
+    return f"{earliest - padding:.3f}", f"{latest + padding:.3f}"
+
+
 def test_detection(detection_manager, detection_data, file_name, file_path, 
-                   skip_cleanup=False):
-    """Test a single detection using the DetectionTestingManager."""
+                   skip_cleanup=False, event_host=None, index_timeout=60,
+                   attack_data_sent=False):
+    """
+    Test a single detection using the DetectionTestingManager.
+    
+    Pass attack_data_sent=True (with the event_host it was sent under) when
+    the data file was already ingested, e.g. by a batch upload.
+    """
     print(f"\n--- Testing detection: {file_name} ---")
     
+    # Every rule gets its own host tag so its data, search and cleanup
+    # never touch events sent for another rule
+    if event_host is None:
+        event_host = make_event_host(make_run_id())
+    
     try:
         # Check if detection has data file to send
         data_file = detection_data.get('data')
         source = detection_data.get('source', 'test')
         sourcetype = detection_data.get('sourcetype', 'test')
+        earliest_time = latest_time = None
         
         if data_file:
             # Construct data file path relative to detection file
@@ -77,27 +168,46 @@ def test_detection(detection_manager, detection_data, file_name, file_path,
                 print(f"❌ Data file not found: {data_file_path}")
                 return False
             
-            print(f"📤 Sending attack data from: {data_file}")
+            if not attack_data_sent:
+                print(f"📤 Sending attack data from: {data_file}")
+                
+                # Send attack data to Splunk
+                detection_manager.send_attack_data(
+                    file_path=str(data_file_path),
+                    source=source,
+                    sourcetype=sourcetype,
+                    host=detection_manager.conn.host,  # Use the Splunk host
+                    event_host=event_host,
+                )
+                print("✅ Attack data sent successfully")
             
-            # Send attack data to Splunk
-            detection_manager.send_attack_data(
-                file_path=str(data_file_path),
-                source=source,
-                sourcetype=sourcetype,
-                host=detection_manager.conn.host,  # Use the Splunk host
+            # Wait until every event from the fixture is searchable, and
+            # bound the search to the fixture's time range
+            expected_events, earliest, latest = event_summary(str(data_file_path))
+            earliest_time, latest_time = fixture_time_window(earliest, latest)
+            time_to_searchable = detection_manager.wait_for_indexed_events(
+                event_host=event_host,
+                expected_count=expected_events,
+                timeout=index_timeout,
+                earliest_time=earliest_time,
+                latest_time=latest_time,
             )
-            print("✅ Attack data sent successfully")
-            
-            # Wait a moment for data to be indexed
-            import time
-            time.sleep(3)
+            print(f"⏱️  {expected_events} event(s) searchable after "
+                  f"{time_to_searchable:.2f}s")
         
-        # Convert sigma detection to Splunk search
-        splunk_search = detection_manager.sigma_to_splunk_conversion(detection_data)
+        # Convert sigma detection to Splunk search scoped to this rule's events
+        if data_file:
+            splunk_search = detection_manager.sigma_to_splunk_conversion(
+                detection_data, index="test", event_host=event_host
+            )
+        else:
+            splunk_search = detection_manager.sigma_to_splunk_conversion(detection_data)
         print(f"Generated Splunk search: {splunk_search}")
         
         # Run the detection
-        result = detection_manager.run_detection(splunk_search)
+        result = detection_manager.run_detection(
+            splunk_search, earliest_time=earliest_time, latest_time=latest_time
+        )
         
         if result:
             print(f"✅ Detection {file_name} triggered successfully")
@@ -109,7 +219,7 @@ def test_detection(detection_manager, detection_data, file_name, file_path,
         # Clean up attack data after testing (unless skip_cleanup is True)
         if data_file and not skip_cleanup:
             print("🧹 Cleaning up attack data...")
-            detection_manager.delete_attack_data()
+            detection_manager.delete_attack_data(event_host=event_host)
             print("✅ Attack data cleaned up")
         
         return detection_result
@@ -119,13 +229,399 @@ def test_detection(detection_manager, detection_data, file_name, file_path,
         # Try to clean up data even if there was an error (unless skip_cleanup)
         try:
             if detection_data.get('data') and not skip_cleanup:
-                detection_manager.delete_attack_data()
+                detection_manager.delete_attack_data(event_host=event_host)
                 print("✅ Attack data cleaned up after error")
         except Exception:
             pass
         return False
 
 
+def check_detection_offline(detection_data, file_name, file_path, rule_index):
+    """
+    Test a single detection against its data file without Splunk.
+    
+    Events are matched through the RuleIndex holding every loaded rule, so
+    the data file is scanned once and other rules it triggers are reported.
+    """
+    print(f"\n--- Testing detection offline: {file_name} ---")
+    
+    try:
+        data_file = detection_data.get('data')
+        if not data_file:
+            print(f"❌ Detection {file_name} has no data file to test offline")
+            return False
+        
+        data_file_path = Path(file_path).parent / data_file
+        if not data_file_path.exists():
+            print(f"❌ Data file not found: {data_file_path}")
+            return False
+        
+        rule = compile_rule(detection_data)
+        event_count = 0
+        matched = 0
+        also_matched = set()
+        # Stream the data file, extracting only the fields the rules read
+        for event in iter_sysmon_events(str(data_file_path), rule_index.fields):
+            event_count += 1
+            hits = rule_index.match(event)
+            if rule in hits:
+                matched += 1
+            also_matched.update(hit.title for hit in hits if hit is not rule)
+        
+        if also_matched:
+            print(f"ℹ️  Data file also matches: {', '.join(sorted(also_matched))}")
+        
+        if matched:
+            print(f"✅ Detection {file_name} matched {matched}/{event_count} "
+                  f"event(s)")
+            return True
+        
+        print(f"❌ Detection {file_name} matched none of {event_count} event(s)")
+        return False
+    
+    except Exception as e:
+        print(f"❌ Error testing detection {file_name} offline: {e}")
+        return False
+
+
+def run_offline_detection_tests(yaml_files):
+    """
+    Load and test every detection with the offline Sigma matcher.
+    
+    Returns:
+        tuple: (successful_tests, failed_tests)
+    """
+    successful_tests = 0
+    failed_tests = 0
+    
+    detections = []
+    for yaml_file in yaml_files:
+        file_name = Path(yaml_file).name
+        detection_data = load_sigma_detection(yaml_file)
+        if detection_data is None:
+            print(f"❌ Skipping {file_name} due to loading errors")
+            failed_tests += 1
+            continue
+        detections.append((yaml_file, file_name, detection_data))
+    
+    # Rules that fail to compile are left out of the index and fail below
+    rule_index = RuleIndex()
+    for _, _, detection_data in detections:
+        try:
+            rule_index.add(compile_rule(detection_data))
+        except Exception:
+            pass
+    
+    for yaml_file, file_name, detection_data in detections:
+        if check_detection_offline(detection_data, file_name, yaml_file, rule_index):
+            successful_tests += 1
+        else:
+            failed_tests += 1
+    
+    return successful_tests, failed_tests
+
+
+def batch_send_attack_data(detection_manager, yaml_files, run_id):
+    """
+    Ingest the data files of every detection in one batched HEC upload.
+    
+    Each detection's events are tagged with its own host under run_id.
+    
+    Returns:
+        dict: yaml_file -> event_host the detection's data was sent under
+    """
+    event_hosts = {}
+    attack_data = []
+    for yaml_file in yaml_files:
+        detection_data = load_sigma_detection(yaml_file)
+        data_file = detection_data.get('data') if detection_data else None
+        if not data_file:
+            continue
+        
+        data_file_path = Path(yaml_file).parent / data_file
+        if not data_file_path.exists():
+            # test_detection reports the missing file
+            continue
+        
+        event_hosts[yaml_file] = make_event_host(run_id)
+        attack_data.append({
+            'file_path': str(data_file_path),
+            'source': detection_data.get('source', 'test'),
+            'sourcetype': detection_data.get('sourcetype', 'test'),
+            'event_host': event_hosts[yaml_file],
+        })
+    
+    print(f"\n📤 Sending attack data for {len(attack_data)} detections in one batch...")
+    requests_sent = detection_manager.send_attack_data_batch(
+        attack_data, host=detection_manager.conn.host
+    )
+    print(f"✅ Attack data sent and acknowledged ({requests_sent} HEC request(s))")
+    return event_hosts
+
+
+def run_detection_tests(yaml_files, manager_factory, run_id, skip_cleanup=False,
+                        workers=1, index_timeout=60, batch_ingest=False):
+    """
+    Load and test every detection, optionally across a pool of workers.
+    
+    Each worker thread gets its own DetectionTestingManager from
+    manager_factory, so HEC channels and Splunk sessions are never shared.
+    With batch_ingest, all data files are uploaded up front in one batch
+    and the workers only wait for indexing, search and clean up. Every
+    detection's events are tagged with a host under run_id.
+    
+    Returns:
+        tuple: (successful_tests, failed_tests)
+    """
+    thread_state = threading.local()
+    managers = []
+    managers_lock = threading.Lock()
+
+    def get_manager():
+        if not hasattr(thread_state, "manager"):
+            thread_state.manager = manager_factory()
+            with managers_lock:
+                managers.append(thread_state.manager)
+        return thread_state.manager
+
+    event_hosts = {}
+    if batch_ingest:
+        event_hosts = batch_send_attack_data(get_manager(), yaml_files, run_id)
+
+    def run_one(yaml_file):
+        file_name = Path(yaml_file).name
+        print(f"\nLoading detection from: {file_name}")
+        
+        detection_data = load_sigma_detection(yaml_file)
+        if detection_data is None:
+            print(f"❌ Skipping {file_name} due to loading errors")
+            return False
+        
+        return test_detection(get_manager(), detection_data, file_name,
+                              yaml_file, skip_cleanup,
+                              event_host=(event_hosts.get(yaml_file)
+                                          or make_event_host(run_id)),
+                              index_timeout=index_timeout,
+                              attack_data_sent=yaml_file in event_hosts)
+
+    if workers <= 1:
+        results = [run_one(yaml_file) for yaml_file in yaml_files]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(run_one, yaml_files))
+
+    ack_latency = LatencyHistogram()
+    for manager in managers:
+        ack_latency.merge(manager.ack_latency)
+    if ack_latency.count:
+        print(f"\n⏱️ HEC ack latency: {ack_latency.summary()}")
+
+    successful_tests = sum(1 for result in results if result)
+    failed_tests = len(results) - successful_tests
+
+    return successful_tests, failed_tests
+
+
+def run_detection_tests_dispatched(yaml_files, detection_manager, run_id,
+                                   skip_cleanup=False, index_timeout=60,
+                                   max_searches=10):
+    """
+    Test every detection with all searches dispatched as concurrent jobs.
+    
+    The data files are uploaded in one batch, then every detection's search
+    is submitted as a non-blocking job, at most max_searches at a time, and
+    the jobs are polled together until all of them are done.
+    
+    Returns:
+        tuple: (successful_tests, failed_tests)
+    """
+    failed_tests = 0
+    detections = {}
+    for yaml_file in yaml_files:
+        detection_data = load_sigma_detection(yaml_file)
+        if detection_data is None:
+            print(f"❌ Skipping {Path(yaml_file).name} due to loading errors")
+            failed_tests += 1
+            continue
+        detections[yaml_file] = detection_data
+    
+    event_hosts = batch_send_attack_data(detection_manager, list(detections), run_id)
+    
+    try:
+        searches = {}
+        time_ranges = {}
+        for yaml_file, detection_data in detections.items():
+            file_name = Path(yaml_file).name
+            try:
+                data_file = detection_data.get('data')
+                if data_file and yaml_file not in event_hosts:
+                    print(f"❌ Data file not found: {Path(yaml_file).parent / data_file}")
+                    failed_tests += 1
+                    continue
+                
+                if data_file:
+                    event_host = event_hosts[yaml_file]
+                    expected_events, earliest, latest = event_summary(
+                        str(Path(yaml_file).parent / data_file)
+                    )
+                    time_ranges[yaml_file] = fixture_time_window(earliest, latest)
+                    detection_manager.wait_for_indexed_events(
+                        event_host=event_host,
+                        expected_count=expected_events,
+                        timeout=index_timeout,
+                        earliest_time=time_ranges[yaml_file][0],
+                        latest_time=time_ranges[yaml_file][1],
+                    )
+                    searches[yaml_file] = detection_manager.sigma_to_splunk_conversion(
+                        detection_data, index="test", event_host=event_host
+                    )
+                else:
+                    searches[yaml_file] = detection_manager.sigma_to_splunk_conversion(
+                        detection_data
+                    )
+            except Exception as e:
+                print(f"❌ Error preparing detection {file_name}: {e}")
+                failed_tests += 1
+        
+        print(f"\n🔎 Dispatching {len(searches)} searches, up to {max_searches} at a time...")
+        results = detection_manager.run_detections(
+            searches, max_concurrent=max_searches, time_ranges=time_ranges
+        )
+        
+        successful_tests = 0
+        for yaml_file in searches:
+            file_name = Path(yaml_file).name
+            if results[yaml_file]:
+                print(f"✅ Detection {file_name} triggered successfully")
+                successful_tests += 1
+            else:
+                print(f"❌ Detection {file_name} did not trigger")
+                failed_tests += 1
+    finally:
+        # Clean up even when dispatching or polling fails, like the
+        # threaded and async paths do
+        if not skip_cleanup:
+            print("🧹 Cleaning up attack data...")
+            for event_host in event_hosts.values():
+                try:
+                    detection_manager.delete_attack_data(event_host=event_host)
+                except Exception as e:
+                    print(f"❌ {e}")
+            print("✅ Attack data cleaned up")
+    
+    return successful_tests, failed_tests
+
+
+async def check_detection_async(detection_manager, detection_data, file_name,
+                               file_path, event_host, skip_cleanup=False,
+                               index_timeout=60):
+    """Test a single detection using the AsyncDetectionTestingManager."""
+    print(f"\n--- Testing detection: {file_name} ---")
+    
+    try:
+        data_file = detection_data.get('data')
+        earliest_time = latest_time = None
+        
+        if data_file:
+            data_file_path = Path(file_path).parent / data_file
+            if not data_file_path.exists():
+                print(f"❌ Data file not found: {data_file_path}")
+                return False
+            
+            print(f"📤 Sending attack data from: {data_file}")
+            await detection_manager.send_attack_data(
+                file_path=str(data_file_path),
+                source=detection_data.get('source', 'test'),
+                sourcetype=detection_data.get('sourcetype', 'test'),
+                host=detection_manager.host,
+                event_host=event_host,
+            )
+            print(f"✅ Attack data sent successfully for {file_name}")
+            
+            expected_events, earliest, latest = event_summary(str(data_file_path))
+            earliest_time, latest_time = fixture_time_window(earliest, latest)
+            time_to_searchable = await detection_manager.wait_for_indexed_events(
+                event_host=event_host,
+                expected_count=expected_events,
+                timeout=index_timeout,
+                earliest_time=earliest_time,
+                latest_time=latest_time,
+            )
+            print(f"⏱️  {expected_events} event(s) for {file_name} searchable after "
+                  f"{time_to_searchable:.2f}s")
+            
+            splunk_search = detection_manager.sigma_to_splunk_conversion(
+                detection_data, index="test", event_host=event_host
+            )
+        else:
+            splunk_search = detection_manager.sigma_to_splunk_conversion(detection_data)
+        
+        result = await detection_manager.run_detection(
+            splunk_search, earliest_time=earliest_time, latest_time=latest_time
+        )
+        
+        if result:
+            print(f"✅ Detection {file_name} triggered successfully")
+        else:
+            print(f"❌ Detection {file_name} did not trigger")
+        
+        if data_file and not skip_cleanup:
+            await detection_manager.delete_attack_data(event_host=event_host)
+            print(f"🧹 Attack data for {file_name} cleaned up")
+        
+        return result
+    
+    except Exception as e:
+        print(f"❌ Error testing detection {file_name}: {e}")
+        try:
+            if detection_data.get('data') and not skip_cleanup:
+                await detection_manager.delete_attack_data(event_host=event_host)
+                print(f"✅ Attack data for {file_name} cleaned up after error")
+        except Exception:
+            pass
+        return False
+
+
+async def run_detection_tests_async(yaml_files, manager_factory, run_id,
+                                    skip_cleanup=False, concurrency=32,
+                                    index_timeout=60):
+    """
+    Test every detection on one event loop with one shared async manager.
+    
+    Up to concurrency detections are in flight at once, bounded by a
+    semaphore, instead of one thread per concurrently tested rule.
+    
+    Returns:
+        tuple: (successful_tests, failed_tests)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async with manager_factory() as detection_manager:
+        
+        async def run_one(yaml_file):
+            async with semaphore:
+                file_name = Path(yaml_file).name
+                detection_data = load_sigma_detection(yaml_file)
+                if detection_data is None:
+                    print(f"❌ Skipping {file_name} due to loading errors")
+                    return False
+                
+                return await check_detection_async(
+                    detection_manager, detection_data, file_name, yaml_file,
+                    make_event_host(run_id), skip_cleanup, index_timeout,
+                )
+        
+        results = await asyncio.gather(
+            *(run_one(yaml_file) for yaml_file in yaml_files)
+        )
+        
+        if detection_manager.ack_latency.count:
+            print(f"\n⏱️ HEC ack latency: {detection_manager.ack_latency.summary()}")
+    
+    successful_tests = sum(1 for result in results if result)
+    return successful_tests, len(results) - successful_tests
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Test sigma detection rules using Splunk",
@@ -143,14 +639,43 @@ Example usage:
   # Skip automatic cleanup
   python test_detections.py --no-cleanup /path/to/detections/folder
   
+  # Delete the whole run's data with one search at the end
+  python test_detections.py --cleanup run /path/to/detections/folder
+  
+  # Test 8 detections at a time
+  python test_detections.py --workers 8 /path/to/detections/folder
+  
+  # Check true positives locally against the data files, without Splunk
+  python test_detections.py --offline /path/to/detections/folder
+  
+  # Upload every data file in one batched HEC request before testing
+  python test_detections.py --batch-ingest --workers 8 /path/to/detections/folder
+  
+  # Upload everything, then run all searches as concurrent non-blocking jobs
+  python test_detections.py --dispatch --max-searches 10 /path/to/detections/folder
+  
+  # Drive 64 detections at a time from a single asyncio event loop
+  python test_detections.py --async --concurrency 64 /path/to/detections/folder
+  
+  # Only test detections whose rule or data file changed since main
+  python test_detections.py --changed-since origin/main /path/to/detections/folder
+  
   # Set environment variables first:
   export SPLUNK_HOST="192.168.1.100"
   export SPLUNK_USERNAME="admin" 
   export SPLUNK_PASSWORD="password"
   export SPLUNK_HEC_TOKEN="your-actual-hec-token"
   
-Note: Attack data is automatically sent and cleaned up for each detection.
-      Use --no-cleanup to preserve test data in Splunk for analysis.
+Note: --offline evaluates each rule against its data file in Python and
+      does not need the environment variables above.
+      Attack data is automatically sent and cleaned up for each detection.
+      Each detection's events are tagged with the host <run-id>-<n>, so
+      parallel workers and concurrent runs never see or delete each
+      other's data.
+      --cleanup rule (default) deletes each detection's events after its
+      test, --cleanup run deletes all of the run's events in one search at
+      the end, and --cleanup none (or --no-cleanup) keeps them, e.g. when
+      index=test has a short retention period.
       HEC token must be configured in Splunk beforehand.
         """
     )
@@ -163,51 +688,236 @@ Note: Attack data is automatically sent and cleaned up for each detection.
     parser.add_argument(
         '--no-cleanup',
         action='store_true',
-        help='Skip automatic cleanup of test data after each detection'
+        help='Skip automatic cleanup of test data (same as --cleanup none)'
+    )
+    
+    parser.add_argument(
+        '--cleanup',
+        choices=['rule', 'run', 'none'],
+        default='rule',
+        help='Delete test data after each detection, once at the end of the run, '
+             'or never (default: rule)'
+    )
+    
+    parser.add_argument(
+        '--run-id',
+        help='Prefix of the host tags of this run\'s events (default: random)'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of detections to test concurrently (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--index-timeout',
+        type=float,
+        default=60,
+        help='Seconds to wait for sent attack data to become searchable (default: 60)'
+    )
+    
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='Evaluate detections against their data files locally instead of in Splunk'
+    )
+    
+    parser.add_argument(
+        '--batch-ingest',
+        action='store_true',
+        help='Upload all data files in one batched HEC request before testing'
+    )
+    
+    parser.add_argument(
+        '--gzip',
+        action='store_true',
+        help='Gzip-compress attack data sent to HEC'
+    )
+    
+    parser.add_argument(
+        '--hec-token-cache',
+        metavar='PATH',
+        help='Cache the resolved HEC token in this file for later runs'
+    )
+    
+    parser.add_argument(
+        '--hec-token-ttl',
+        type=float,
+        default=3600,
+        help='Seconds a token from --hec-token-cache is reused (default: 3600)'
+    )
+    
+    parser.add_argument(
+        '--first-match',
+        action='store_true',
+        help="Stop each detection search at its first result ('| head 1')"
+    )
+    
+    parser.add_argument(
+        '--dispatch',
+        action='store_true',
+        help='Batch-ingest all data, then run every search as a concurrent non-blocking job'
+    )
+    
+    parser.add_argument(
+        '--max-searches',
+        type=int,
+        default=10,
+        help='Maximum concurrent search jobs with --dispatch; keep within the '
+             "Splunk user's search quota (default: 10)"
+    )
+    
+    parser.add_argument(
+        '--async',
+        dest='use_async',
+        action='store_true',
+        help='Test detections concurrently on one asyncio event loop instead of worker threads'
+    )
+    
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=32,
+        help='Number of detections in flight at once with --async (default: 32)'
+    )
+    
+    parser.add_argument(
+        '--changed-since',
+        metavar='REF',
+        help='Only test detections whose rule or data file changed since this git ref'
     )
     
     args = parser.parse_args()
     
+    if args.no_cleanup:
+        args.cleanup = 'none'
+    if args.run_id and not re.fullmatch(r'[A-Za-z0-9_.-]+', args.run_id):
+        parser.error("--run-id may only contain letters, digits, '_', '.' and '-'")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.max_searches < 1:
+        parser.error("--max-searches must be at least 1")
+    if args.use_async and (args.batch_ingest or args.dispatch):
+        parser.error("--batch-ingest and --dispatch are not supported with --async")
+    
     try:
-        # Load environment variables
-        print("Loading environment variables...")
-        env_vars = load_environment_variables()
-        print(f"Connecting to Splunk host: {env_vars['host']}")
-        
-        # Initialize DetectionTestingManager
-        detection_manager = DetectionTestingManager(
-            host=env_vars['host'],
-            username=env_vars['username'],
-            password=env_vars['password'],
-        )
-        
-        print("DetectionTestingManager initialized with predefined HEC configuration")
-        
-        # Find YAML files
-        print(f"\nSearching for YAML files in: {args.folder_path}")
-        yaml_files = find_yaml_files(args.folder_path)
-        print(f"Found {len(yaml_files)} YAML files")
+        if args.offline:
+            # Find YAML files
+            print(f"Searching for YAML files in: {args.folder_path}")
+            yaml_files = find_yaml_files(args.folder_path)
+            print(f"Found {len(yaml_files)} YAML files")
+            
+            if args.changed_since:
+                yaml_files = select_changed_detections(yaml_files, args.changed_since)
+                print(f"{len(yaml_files)} detection(s) changed since {args.changed_since}")
+            
+            successful_tests, failed_tests = run_offline_detection_tests(yaml_files)
+        else:
+            # Load environment variables
+            print("Loading environment variables...")
+            env_vars = load_environment_variables()
+            print(f"Connecting to Splunk host: {env_vars['host']}")
         
-        # Test each detection
-        successful_tests = 0
-        failed_tests = 0
+            # Each worker builds its own DetectionTestingManager on first use;
+            # they all share one Sigma conversion cache
+            conversion_cache = ConversionCache()
+            hec_token_cache = (
+                HecTokenCache(args.hec_token_cache, ttl=args.hec_token_ttl)
+                if args.hec_token_cache else None
+            )
+            
+            def manager_factory():
+                return DetectionTestingManager(
+                    host=env_vars['host'],
+                    username=env_vars['username'],
+                    password=env_vars['password'],
+                    conversion_cache=conversion_cache,
+                    hec_compress=args.gzip,
+                    first_match=args.first_match,
+                    hec_token_cache=hec_token_cache,
+                )
         
-        for yaml_file in yaml_files:
-            file_name = Path(yaml_file).name
-            print(f"\nLoading detection from: {file_name}")
+            # Find YAML files
+            print(f"\nSearching for YAML files in: {args.folder_path}")
+            yaml_files = find_yaml_files(args.folder_path)
+            print(f"Found {len(yaml_files)} YAML files")
             
-            detection_data = load_sigma_detection(yaml_file)
-            if detection_data is None:
-                print(f"❌ Skipping {file_name} due to loading errors")
-                failed_tests += 1
-                continue
+            if args.changed_since:
+                yaml_files = select_changed_detections(yaml_files, args.changed_since)
+                print(f"{len(yaml_files)} detection(s) changed since {args.changed_since}")
+        
+            # Convert the whole rule set in one batch up front; the tests
+            # below then read every search from the shared cache
+            detections = [load_sigma_detection(yaml_file) for yaml_file in yaml_files]
+            searches, errors = convert_sigma_rules(
+                [detection for detection in detections if detection],
+                conversion_cache,
+            )
+            print(f"Converted {len(searches)} detections to Splunk searches")
+            for key, error in errors.items():
+                print(f"❌ Conversion failed for {key}: {error}")
             
-            # Test the detection
-            if test_detection(detection_manager, detection_data, file_name, 
-                              yaml_file, args.no_cleanup):
-                successful_tests += 1
-            else:
-                failed_tests += 1
+            # Test each detection; per-detection cleanup only with --cleanup rule
+            run_id = args.run_id or make_run_id()
+            skip_cleanup = args.cleanup != 'rule'
+            print(f"Test run id: {run_id}")
+            try:
+                if args.use_async:
+                    # Only --async needs aiohttp
+                    from async_detection_testing_manager import AsyncDetectionTestingManager
+                    
+                    def async_manager_factory():
+                        return AsyncDetectionTestingManager(
+                            host=env_vars['host'],
+                            username=env_vars['username'],
+                            password=env_vars['password'],
+                            conversion_cache=conversion_cache,
+                            hec_compress=args.gzip,
+                            first_match=args.first_match,
+                            hec_token_cache=hec_token_cache,
+                        )
+                    
+                    print(f"Testing up to {args.concurrency} detection(s) at a time")
+                    successful_tests, failed_tests = asyncio.run(
+                        run_detection_tests_async(
+                            yaml_files,
+                            async_manager_factory,
+                            run_id,
+                            skip_cleanup=skip_cleanup,
+                            concurrency=args.concurrency,
+                            index_timeout=args.index_timeout,
+                        )
+                    )
+                elif args.dispatch:
+                    successful_tests, failed_tests = run_detection_tests_dispatched(
+                        yaml_files,
+                        manager_factory(),
+                        run_id,
+                        skip_cleanup=skip_cleanup,
+                        index_timeout=args.index_timeout,
+                        max_searches=args.max_searches,
+                    )
+                else:
+                    print(f"Testing with {args.workers} worker(s)")
+                    successful_tests, failed_tests = run_detection_tests(
+                        yaml_files,
+                        manager_factory,
+                        run_id,
+                        skip_cleanup=skip_cleanup,
+                        workers=args.workers,
+                        index_timeout=args.index_timeout,
+                        batch_ingest=args.batch_ingest,
+                    )
+            finally:
+                # The run's data is removed even if the tests errored out
+                if args.cleanup == 'run':
+                    print(f"\n🧹 Cleaning up attack data for run {run_id}...")
+                    manager_factory().delete_run_data(run_id)
+                    print("✅ Attack data cleaned up")
         
         # Summary
         print(f"\n{'='*50}")
@@ -221,8 +931,8 @@ Note: Attack data is automatically sent and cleaned up for each detection.
         print(f"Success rate: {success_rate:.1f}%")
         
         # Note about cleanup
-        if args.no_cleanup:
-            print("\n⚠️  Test data was not cleaned up (--no-cleanup flag used)")
+        if args.cleanup == 'none' and not args.offline:
+            print("\n⚠️  Test data was not cleaned up (--cleanup none / --no-cleanup used)")
             print("   You may want to manually clean up test data in Splunk")
         
         # Exit with appropriate code
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from event_store import ColumnarEventStore, find_xml_files
+from sigma_matcher import SigmaRule
+from sysmon_events import iter_sysmon_events
+from test_rule_index import DETECTIONS_DIR, load_rules, random_event, rule_literals
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_count_matches_agrees_with_matching_events(seed):
+    rng = random.Random(seed)
+    rules = load_rules()
+    literals = rule_literals(rules)
+    events = [random_event(rng, literals) for _ in range(2000)]
+
+    store = ColumnarEventStore()
+    store.extend(events)
+    assert len(store) == len(events)
+
+    for rule in rules:
+        expected = rule.matching_events(events)
+        assert store.count_matches(rule) == len(expected), rule.title
+        rows = store.match_mask(rule).nonzero()[0]
+        assert [events[row] for row in rows] == expected, rule.title
+
+
+def test_rows_round_trip_with_late_fields():
+    events = [{"Image": "a.exe"}, {}, {"CommandLine": "x", "Image": "a.exe"}, {"User": ""}]
+    store = ColumnarEventStore()
+    store.extend(events)
+    assert [store.event(row) for row in range(len(events))] == events
+
+
+def test_field_subset_keeps_matches():
+    rule = SigmaRule({
+        "title": "rar",
+        "detection": {
+            "sel": {"Image|endswith": "\\rar.exe", "CommandLine|contains": " a "},
+            "condition": "sel",
+        },
+    })
+    events = [
+        {"Image": "C:\\rar.exe", "CommandLine": "rar a x.rar", "User": "bob"},
+        {"Image": "C:\\rar.exe", "CommandLine": "rar x x.rar", "User": "bob"},
+    ]
+    store = ColumnarEventStore(fields=rule.fields)
+    store.extend(events)
+    assert store.count_matches(rule) == 1
+    assert store.event(0) == {"Image": "C:\\rar.exe", "CommandLine": "rar a x.rar"}
+
+
+def test_fixture_files_agree_with_matching_events():
+    rules = load_rules()
+    files = find_xml_files(DETECTIONS_DIR / "sysmon_logs")
+    assert files
+
+    events = [event for path in files for event in iter_sysmon_events(str(path))]
+    store = ColumnarEventStore.from_files(files)
+    for rule in rules:
+        assert store.count_matches(rule) == len(rule.matching_events(events)), rule.title
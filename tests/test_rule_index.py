@@ -0,0 +1,136 @@
+import random
+from pathlib import Path
+
+import pytest
+import yaml
+
+from rule_index import AhoCorasick, RuleIndex
+from sigma_matcher import SigmaRule, split_sigma_string
+
+
+DETECTIONS_DIR = Path(__file__).resolve().parent.parent / "detections"
+
+FIELDS = ("Image", "CommandLine", "ParentImage", "User")
+
+# Synthetic rules exercising every anchor path: all/any value lists,
+# wildcards, regexes, nulls, keywords, 'not' and 'x of' conditions
+SYNTHETIC_DETECTIONS = [
+    {"sel": {"Image|endswith": ["\\cmd.exe", "\\powershell.exe"]}, "condition": "sel"},
+    {"sel": {"CommandLine|contains|all": ["-enc", "bypass"]}, "condition": "sel"},
+    {"sel": {"CommandLine|contains": "/s *.dll"}, "condition": "sel"},
+    {"sel": {"CommandLine|re": "-[Ee]nc\\s"}, "condition": "sel"},
+    {"sel": {"ParentImage": None}, "condition": "sel"},
+    {"sel": {"User|cased": "SYSTEM"}, "condition": "sel"},
+    {"keywords": ["mimikatz"], "condition": "keywords"},
+    {"filter": {"User": "system"}, "condition": "not filter"},
+    {
+        "sel_a": {"Image|startswith": "C:\\Users\\"},
+        "sel_b": {"ParentImage|endswith": "\\explorer.exe"},
+        "filter": {"CommandLine|contains": "update"},
+        "condition": "1 of sel_* and not filter",
+    },
+    {
+        "a": {"Image|endswith": "\\rar.exe", "CommandLine|contains": " a "},
+        "b": [{"User": "admin"}, {"CommandLine|contains": "-hp"}],
+        "condition": "all of them",
+    },
+    {
+        "a": {"Image": "*\\7z?.exe"},
+        "b": {"CommandLine|endswith": "\\*.dmp"},
+        "condition": "a or b",
+    },
+]
+
+
+def load_rules():
+    rules = [
+        SigmaRule(yaml.safe_load(path.read_text(encoding="utf-8")))
+        for path in sorted(DETECTIONS_DIR.glob("*.yml"))
+    ]
+    rules += [
+        SigmaRule({"title": f"synthetic {i}", "detection": detection})
+        for i, detection in enumerate(SYNTHETIC_DETECTIONS)
+    ]
+    return rules
+
+
+def rule_literals(rules):
+    """Every literal chunk the rules mention, to build events that hit them."""
+    literals = set()
+    for rule in rules:
+        for groups in rule.selections.values():
+            for group in groups:
+                for field_matcher in group:
+                    for pattern in field_matcher.patterns:
+                        if pattern.value is not None and pattern.mode != "re":
+                            literals.update(
+                                token for token in split_sigma_string(str(pattern.value))
+                                if isinstance(token, str)
+                            )
+    return sorted(literals)
+
+
+def random_value(rng, literals):
+    parts = []
+    for _ in range(rng.randint(0, 4)):
+        if rng.random() < 0.6:
+            part = rng.choice(literals)
+        else:
+            part = rng.choice(["", " ", "x", "\\", "-enc ", "SYSTEM", "mimikatz", ".exe"])
+        if rng.random() < 0.3:
+            part = part.upper() if rng.random() < 0.5 else part.swapcase()
+        parts.append(part)
+    return "".join(parts)
+
+
+def random_event(rng, literals):
+    event = {}
+    for field in FIELDS:
+        roll = rng.random()
+        if roll < 0.15:
+            continue
+        event[field] = "" if roll < 0.2 else random_value(rng, literals)
+    return event
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_rule_index_matches_brute_force(seed):
+    rng = random.Random(seed)
+    rules = load_rules()
+    literals = rule_literals(rules)
+    index = RuleIndex(rules)
+
+    matched = 0
+    for _ in range(2000):
+        event = random_event(rng, literals)
+        expected = [rule for rule in rules if rule.matches(event)]
+        assert index.match(event) == expected, event
+        matched += bool(expected)
+
+    # The generator must actually produce hits for the check to mean much
+    assert matched > 100
+
+
+def test_rule_index_rebuilds_after_add():
+    first, second = load_rules()[:2]
+    index = RuleIndex([first])
+    event = {"Image": "C:\\Tools\\7z.exe", "CommandLine": "7z a out.7z lsass.dmp"}
+    index.match(event)
+    index.add(second)
+    assert index.match(event) == [rule for rule in (first, second) if rule.matches(event)]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_aho_corasick_matches_substring_search(seed):
+    rng = random.Random(seed)
+    alphabet = "abc"
+    literals = {
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4)))
+        for _ in range(15)
+    }
+    automaton = AhoCorasick(literals)
+
+    for _ in range(500):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))
+        found = {automaton.literals[literal_id] for literal_id in automaton.search(text)}
+        assert found == {literal for literal in literals if literal in text}
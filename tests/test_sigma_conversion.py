@@ -0,0 +1,65 @@
+import pytest
+
+from sigma_conversion import (
+    UNTAGGED_RULE,
+    combined_rule_search,
+    eval_string,
+    is_event_search,
+)
+
+
+@pytest.mark.parametrize("splunk_search, expected", [
+    ('Image="*\\\\rar.exe" CommandLine="* a *"', True),
+    ('CommandLine="cmd /c a | b"', True),
+    ('CommandLine="say \\"a | b\\" now"', True),
+    ('CommandLine="trailing\\\\" | stats count', False),
+    ('EventID=1 | stats count by Image', False),
+    ('CommandLine="unterminated | still quoted', True),
+    ('', True),
+])
+def test_is_event_search(splunk_search, expected):
+    assert is_event_search(splunk_search) is expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("plain", '"plain"'),
+    ('say "hi"', '"say \\"hi\\""'),
+    ("C:\\Windows\\", '"C:\\\\Windows\\\\"'),
+    ('\\"', '"\\\\\\""'),
+])
+def test_eval_string(value, expected):
+    assert eval_string(value) == expected
+
+
+def test_combined_rule_search():
+    search = combined_rule_search({
+        "rule-a": 'Image="*\\\\rar.exe"',
+        "rule-b": "search  EventID=1 ",
+    })
+    assert search == (
+        '((Image="*\\\\rar.exe") OR (EventID=1)) '
+        '| eval rule_id=mvappend('
+        'if(searchmatch("Image=\\"*\\\\\\\\rar.exe\\""), "rule-a", null()), '
+        'if(searchmatch("EventID=1"), "rule-b", null())) '
+        f'| fillnull value="{UNTAGGED_RULE}" rule_id'
+    )
+
+
+def test_combined_rule_search_quotes_keys_and_uses_rule_field():
+    search = combined_rule_search({'odd "key" \\': "EventID=1"}, rule_field="rules")
+    assert '"odd \\"key\\" \\\\", null()' in search
+    assert "| eval rules=mvappend(" in search
+    assert search.endswith(" rules")
+
+
+def test_combined_rule_search_keeps_quoted_pipes():
+    search = combined_rule_search({"a": 'CommandLine="a | b"'})
+    assert search.startswith('((CommandLine="a | b")) | eval')
+
+
+def test_combined_rule_search_rejects_pipes():
+    with pytest.raises(ValueError, match="rule-b"):
+        combined_rule_search({
+            "rule-a": "EventID=1",
+            "rule-b": "EventID=1 | stats count",
+        })
@@ -0,0 +1,210 @@
+import pytest
+
+from sigma_matcher import SigmaMatchError, SigmaRule, split_sigma_string, WILDCARD_MULTI
+
+
+def make_rule(detection):
+    return SigmaRule({"title": "test rule", "detection": detection})
+
+
+def matches(detection, event):
+    return make_rule(detection).matches(event)
+
+
+def test_equals_is_case_insensitive_and_exact():
+    detection = {"sel": {"Image": "C:\\Windows\\cmd.exe"}, "condition": "sel"}
+    assert matches(detection, {"Image": "c:\\windows\\CMD.EXE"})
+    assert not matches(detection, {"Image": "C:\\Windows\\cmd.exe.bak"})
+    assert not matches(detection, {})
+
+
+def test_contains_startswith_endswith():
+    assert matches(
+        {"sel": {"CommandLine|contains": "-enc"}, "condition": "sel"},
+        {"CommandLine": "powershell -ENC abc"},
+    )
+    assert matches(
+        {"sel": {"Image|startswith": "C:\\Users\\"}, "condition": "sel"},
+        {"Image": "c:\\users\\bob\\a.exe"},
+    )
+    assert not matches(
+        {"sel": {"Image|startswith": "C:\\Users\\"}, "condition": "sel"},
+        {"Image": "D:\\C:\\Users\\a.exe"},
+    )
+    assert matches(
+        {"sel": {"Image|endswith": "\\rar.exe"}, "condition": "sel"},
+        {"Image": "C:\\Tools\\Rar.exe"},
+    )
+    assert not matches(
+        {"sel": {"Image|endswith": "\\rar.exe"}, "condition": "sel"},
+        {"Image": "C:\\Tools\\unrar.exe"},
+    )
+
+
+def test_value_list_is_or_and_all_modifier_is_and():
+    any_of = {"sel": {"CommandLine|contains": ["foo", "bar"]}, "condition": "sel"}
+    all_of = {"sel": {"CommandLine|contains|all": ["foo", "bar"]}, "condition": "sel"}
+
+    assert matches(any_of, {"CommandLine": "x bar"})
+    assert not matches(all_of, {"CommandLine": "x bar"})
+    assert matches(all_of, {"CommandLine": "bar foo"})
+
+
+def test_wildcards_in_modified_values():
+    detection = {"sel": {"CommandLine|contains": "/s *.dll"}, "condition": "sel"}
+    assert matches(detection, {"CommandLine": "regsvr32 /s C:\\x\\evil.dll /i"})
+    assert not matches(detection, {"CommandLine": "regsvr32 /u evil.dll"})
+
+    single = {"sel": {"Image": "a?c.exe"}, "condition": "sel"}
+    assert matches(single, {"Image": "abc.exe"})
+    assert not matches(single, {"Image": "ac.exe"})
+
+
+def test_re_modifier_searches_case_sensitively():
+    detection = {"sel": {"CommandLine|re": "-[Ee]nc\\s"}, "condition": "sel"}
+    assert matches(detection, {"CommandLine": "powershell -enc AAA"})
+    assert not matches(detection, {"CommandLine": "powershell -ENC AAA"})
+    assert not matches(detection, {})
+
+
+def test_cased_modifier():
+    detection = {"sel": {"CommandLine|contains|cased": "Invoke-"}, "condition": "sel"}
+    assert matches(detection, {"CommandLine": "Invoke-Mimikatz"})
+    assert not matches(detection, {"CommandLine": "invoke-mimikatz"})
+
+    exact = {"sel": {"User|cased": "SYSTEM"}, "condition": "sel"}
+    assert matches(exact, {"User": "SYSTEM"})
+    assert not matches(exact, {"User": "system"})
+
+
+def test_escaped_wildcards_are_literals():
+    assert split_sigma_string("a\\*b*") == ["a*b", WILDCARD_MULTI]
+    assert split_sigma_string("C:\\attrib.exe") == ["C:\\attrib.exe"]
+    assert split_sigma_string("a\\\\*") == ["a\\", WILDCARD_MULTI]
+
+    detection = {"sel": {"CommandLine|endswith": "\\*.dmp"}, "condition": "sel"}
+    assert matches(detection, {"CommandLine": "7z a out.7z *.dmp"})
+    assert not matches(detection, {"CommandLine": "7z a out.7z lsass.dmp"})
+
+    question = {"sel": {"Image": "what\\?.exe"}, "condition": "sel"}
+    assert matches(question, {"Image": "what?.exe"})
+    assert not matches(question, {"Image": "whatx.exe"})
+
+
+def test_null_matches_missing_or_empty_field():
+    detection = {"sel": {"ParentImage": None}, "condition": "sel"}
+    assert matches(detection, {})
+    assert matches(detection, {"ParentImage": ""})
+    assert not matches(detection, {"ParentImage": "C:\\explorer.exe"})
+
+    either = {"sel": {"ParentImage": [None, "x.exe"]}, "condition": "sel"}
+    assert matches(either, {})
+    assert matches(either, {"ParentImage": "X.exe"})
+    assert not matches(either, {"ParentImage": "y.exe"})
+
+
+def test_list_of_maps_is_or_of_groups():
+    detection = {
+        "sel": [
+            {"Image|endswith": "\\a.exe", "CommandLine|contains": "x"},
+            {"Image|endswith": "\\b.exe"},
+        ],
+        "condition": "sel",
+    }
+    assert matches(detection, {"Image": "C:\\a.exe", "CommandLine": "-x"})
+    assert not matches(detection, {"Image": "C:\\a.exe", "CommandLine": "-y"})
+    assert matches(detection, {"Image": "C:\\b.exe"})
+
+
+def test_keywords_search_every_field():
+    detection = {"keywords": ["mimikatz", "sekurlsa"], "condition": "keywords"}
+    rule = make_rule(detection)
+    assert rule.fields is None
+    assert rule.matches({"CommandLine": "run SEKURLSA::logonpasswords"})
+    assert not rule.matches({"CommandLine": "notepad"})
+
+
+def test_not_and_precedence():
+    detection = {
+        "a": {"Image|endswith": "\\regsvr32.exe"},
+        "b": {"CommandLine|contains": ".dll"},
+        "filter": {"CommandLine|contains": "\\Avira\\"},
+        "condition": "a and b and not filter",
+    }
+    assert matches(detection, {"Image": "C:\\regsvr32.exe", "CommandLine": "/s x.dll"})
+    assert not matches(
+        detection,
+        {"Image": "C:\\regsvr32.exe", "CommandLine": "/s C:\\Avira\\x.dll"},
+    )
+
+    # 'and' binds tighter than 'or'
+    precedence = {
+        "a": {"F": "1"}, "b": {"G": "1"}, "c": {"H": "1"},
+        "condition": "a or b and c",
+    }
+    assert matches(precedence, {"F": "1"})
+    assert not matches(precedence, {"G": "1"})
+    grouped = dict(precedence, condition="(a or b) and c")
+    assert not matches(grouped, {"F": "1"})
+    assert matches(grouped, {"G": "1", "H": "1"})
+
+
+def test_one_of_pattern_and_all_of_them():
+    detection = {
+        "sel_a": {"F": "a"},
+        "sel_b": {"G": "b"},
+        "other": {"H": "h"},
+        "_helper": {"X": "never"},
+        "condition": "1 of sel_* and other",
+    }
+    assert matches(detection, {"G": "b", "H": "h"})
+    assert not matches(detection, {"G": "b"})
+    assert not matches(detection, {"H": "h"})
+
+    all_of_them = dict(detection, condition="all of them")
+    # Items starting with '_' are excluded from 'them'
+    assert matches(all_of_them, {"F": "a", "G": "b", "H": "h"})
+    assert not matches(all_of_them, {"F": "a", "G": "b"})
+
+    all_of_pattern = dict(detection, condition="all of sel_*")
+    assert matches(all_of_pattern, {"F": "a", "G": "b"})
+    assert not matches(all_of_pattern, {"F": "a"})
+
+
+def test_condition_list_is_or():
+    detection = {"a": {"F": "1"}, "b": {"G": "1"}, "condition": ["a", "b"]}
+    assert matches(detection, {"G": "1"})
+    assert not matches(detection, {"H": "1"})
+
+
+def test_fields_cover_only_referenced_selections():
+    rule = make_rule({
+        "a": {"Image|endswith": "x"},
+        "unused": {"User": "y"},
+        "condition": "a",
+    })
+    assert rule.fields == {"Image"}
+
+
+def test_matching_events():
+    rule = make_rule({"sel": {"F|contains": "x"}, "condition": "sel"})
+    events = [{"F": "x"}, {"F": "y"}, {}, {"F": "xx"}]
+    assert rule.matching_events(events) == [{"F": "x"}, {"F": "xx"}]
+
+
+@pytest.mark.parametrize("detection, message", [
+    ({"sel": {"F": "x"}}, "no detection condition"),
+    ({"sel": {"F|base64": "x"}, "condition": "sel"}, "Unsupported modifier"),
+    ({"sel": {"F": "x"}, "condition": "sel | count() > 5"}, "Aggregations"),
+    ({"sel": {"F": "x"}, "condition": "missing"}, "Unknown detection item"),
+    ({"sel": {"F": "x"}, "condition": "(sel"}, "Unexpected end"),
+    ({"sel": {"F": "x"}, "condition": "(sel sel)"}, "Unbalanced parentheses"),
+    ({"sel": {"F": "x"}, "condition": "sel sel"}, "Unexpected token"),
+    ({"sel": {"F": "x"}, "condition": "sel and"}, "Unexpected end"),
+    ({"sel": {"F": "x"}, "condition": "1 of filter_*"}, "matches no detection items"),
+    ({"sel": "x", "condition": "sel"}, "Unsupported definition"),
+    ({"sel": [{"F": "x"}, "y"], "condition": "sel"}, "Unsupported definition"),
+])
+def test_unsupported_rules_raise(detection, message):
+    with pytest.raises(SigmaMatchError, match=message):
+        make_rule(detection)
@@ -0,0 +1,113 @@
+import xml.etree.ElementTree as ET
+
+from sysmon_events import (
+    event_summary,
+    iter_event_chunks,
+    iter_raw_events,
+    iter_sysmon_events,
+    parse_event,
+    record_time,
+)
+
+
+NAMESPACE = "http://schemas.microsoft.com/win/2004/08/events/event"
+
+
+def make_event(record_id, system_time="2025-09-04T15:38:20.1086214Z",
+               image="C:\\Windows\\System32\\cmd.exe"):
+    time_created = (
+        f"<TimeCreated SystemTime='{system_time}'/>" if system_time else ""
+    )
+    return (
+        f"<Event xmlns='{NAMESPACE}'><System>"
+        f"<Provider Name='Microsoft-Windows-Sysmon'/><EventID>1</EventID>"
+        f"{time_created}<EventRecordID>{record_id}</EventRecordID>"
+        f"<Computer>LAB8</Computer></System><EventData>"
+        f"<Data Name='Image'>{image}</Data><Data Name='CommandLine'/>"
+        f"</EventData></Event>"
+    )
+
+
+def write_export(tmp_path, events, prefix="", separator="\n"):
+    path = tmp_path / "events.xml"
+    path.write_bytes((prefix + separator.join(events)).encode("utf-8"))
+    return str(path)
+
+
+def test_parse_event_flattens_system_and_event_data():
+    event = parse_event(ET.fromstring(make_event(7)))
+    assert event == {
+        "Provider_Name": "Microsoft-Windows-Sysmon",
+        "EventID": "1",
+        "TimeCreated": "2025-09-04T15:38:20.1086214Z",
+        "EventRecordID": "7",
+        "Computer": "LAB8",
+        "Image": "C:\\Windows\\System32\\cmd.exe",
+        "CommandLine": "",
+    }
+
+
+def test_parse_event_keeps_only_requested_fields():
+    event = parse_event(ET.fromstring(make_event(7)), fields={"Image", "EventID"})
+    assert event == {"EventID": "1", "Image": "C:\\Windows\\System32\\cmd.exe"}
+
+
+def test_iter_raw_events_skips_bom_and_declaration(tmp_path):
+    path = write_export(
+        tmp_path,
+        [make_event(1), make_event(2)],
+        prefix="\ufeff<?xml version='1.0' encoding='utf-8'?>\n",
+    )
+    records = list(iter_raw_events(path))
+    assert len(records) == 2
+    assert all(record.startswith(b"<Event") for record in records)
+
+
+def test_iter_raw_events_splits_across_chunks(tmp_path):
+    events = [make_event(i) for i in range(20)]
+    path = write_export(tmp_path, events, separator="\r\n")
+    # Chunks much smaller than one record force records to span reads
+    records = list(iter_raw_events(path, chunk_size=17))
+    assert [record.decode() for record in records] == events
+
+
+def test_iter_sysmon_events(tmp_path):
+    path = write_export(tmp_path, [make_event(i) for i in range(3)])
+    events = list(iter_sysmon_events(path, fields={"EventRecordID"}))
+    assert events == [{"EventRecordID": str(i)} for i in range(3)]
+
+
+def test_iter_event_chunks_respects_size_and_boundaries(tmp_path):
+    events = [make_event(i) for i in range(10)]
+    path = write_export(tmp_path, events)
+    record_bytes = len(events[0]) + 1
+
+    chunks = list(iter_event_chunks(path, max_chunk_bytes=3 * record_bytes))
+    assert [len(chunk) for chunk in chunks] == [3 * record_bytes] * 3 + [record_bytes]
+    assert b"".join(chunks).decode() == "".join(event + "\n" for event in events)
+
+    # A record larger than the limit is still sent, on its own
+    assert len(list(iter_event_chunks(path, max_chunk_bytes=1))) == 10
+
+
+def test_record_time():
+    assert record_time(make_event(1, "2025-01-01T00:00:00Z").encode()) == 1735689600.0
+    assert record_time(
+        make_event(1, "2025-01-01T00:00:01.5Z").encode()
+    ) == 1735689601.5
+    assert record_time(make_event(1, system_time=None).encode()) is None
+
+
+def test_event_summary(tmp_path):
+    path = write_export(tmp_path, [
+        make_event(1, "2025-01-01T00:00:10Z"),
+        make_event(2, system_time=None),
+        make_event(3, "2025-01-01T00:00:00Z"),
+        make_event(4, "2025-01-01T00:00:05Z"),
+    ])
+    assert event_summary(path) == (4, 1735689600.0, 1735689610.0)
+
+
+def test_event_summary_without_timestamps(tmp_path):
+    path = write_export(tmp_path, [make_event(1, system_time=None)])
+    assert event_summary(path) == (1, None, None)